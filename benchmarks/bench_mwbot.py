@@ -0,0 +1,208 @@
+# MIT License
+#
+# Copyright (c) 2024 Chris Fisher ("cdfisher")
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""bench_mwbot.py - (c) 2024 Chris Fisher ("cdfisher")
+Benchmarks of Mwbot against the local mock API in mock_api.py, at several corpus sizes, reporting requests/sec,
+pages/sec and peak RSS for each case.
+
+Each corpus is served by its own mock API process and each case runs in a fresh process, so neither the server nor
+earlier cases count towards a case's time or memory. For example:
+
+    python benchmarks/bench_mwbot.py --sizes 1000,10000 --latency 0.02 --workers 4 --json results.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bot.mwbot as mw  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where it can't be measured.
+
+    :return: Peak RSS in bytes.
+    :rtype: int
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def bench_categorymembers(bot):
+    return len(bot.categorymembers('Category:Items'))
+
+
+def bench_allpages_generator(bot):
+    return len(bot.allpages_generator())
+
+
+def bench_transcludedin_generator(bot):
+    return len(bot.transcludedin_generator('Template: Infobox Item'))
+
+
+def bench_gallery_scan(bot):
+    import historic_item_galleries as hig
+
+    pages = 0
+
+    def counted(source):
+        nonlocal pages
+        for page in source:
+            pages += 1
+            yield page
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        # the scan reports on every page it checks
+        with contextlib.redirect_stdout(devnull):
+            results = hig.scan(counted(hig.infobox_pages(bot)))
+            hig.write_entries(os.path.join(tmp, 'galleries.csv'), hig.found(results))
+    return pages
+
+
+CASES = {
+    'categorymembers': bench_categorymembers,
+    'allpages_generator': bench_allpages_generator,
+    'transcludedin_generator': bench_transcludedin_generator,
+    'gallery_scan': bench_gallery_scan,
+}
+
+
+def run_case(name: str, url: str, workers: int) -> dict:
+    """Runs one benchmark case in this process.
+
+    :param name: Name of the case, one of CASES.
+    :type name: str
+
+    :param url: URL of the mock API.
+    :type url: str
+
+    :param workers: Number of concurrent requests the bot may make.
+    :type workers: int
+
+    :return: Results: seconds, requests, pages, and peak RSS in bytes.
+    :rtype: dict
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.file', delete=False) as creds:
+        creds.write('Bench\npassword')
+    try:
+        bot = mw.Mwbot(creds_file=creds.name, api_url=url, workers=workers)
+    finally:
+        os.remove(creds.name)
+
+    start = time.perf_counter()
+    pages = CASES[name](bot)
+    seconds = time.perf_counter() - start
+    requests = sum(row['requests'] for row in bot.metrics.summary())
+    return {'case': name, 'seconds': seconds, 'requests': requests, 'pages': pages, 'peak_rss': peak_rss()}
+
+
+def run_suite(sizes, cases, latency: float, workers: int, content_limit: int, bot: bool, compress: bool):
+    """Runs each case against a mock API serving each corpus size, each in a separate process.
+
+    :return: Generator of result dicts as returned by run_case, with the corpus size added.
+    """
+    for size in sizes:
+        server_args = [sys.executable, os.path.join(ROOT, 'benchmarks', 'mock_api.py'), '--pages', str(size),
+                       '--latency', str(latency), '--content-limit', str(content_limit)]
+        if bot:
+            server_args.append('--bot')
+        if compress:
+            server_args.append('--gzip')
+        server = subprocess.Popen(server_args, stdout=subprocess.PIPE, text=True)
+        try:
+            url = server.stdout.readline().strip()
+            for case in cases:
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', case, '--url', url,
+                                      '--workers', str(workers)], stdout=subprocess.PIPE, text=True, check=True)
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                result['corpus'] = size
+                yield result
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def format_result(result: dict) -> str:
+    rss = f'{result["peak_rss"] / 2 ** 20:.1f}' if result['peak_rss'] is not None else 'n/a'
+    return (f'{result["case"]:<24} {result["corpus"]:>8} {result["seconds"]:>9.2f} {result["requests"]:>9} '
+            f'{result["requests"] / result["seconds"]:>9.1f} {result["pages"] / result["seconds"]:>10.1f} {rss:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Mwbot against a local mock MediaWiki API')
+    parser.add_argument('--sizes', default='1000,5000,20000',
+                        help='comma separated corpus sizes to run at (default: 1000,5000,20000)')
+    parser.add_argument('--cases', default=','.join(CASES),
+                        help=f'comma separated cases to run (default: all of {", ".join(CASES)})')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds the mock API takes to answer each request (default: 0.01)')
+    parser.add_argument('--workers', type=int, default=1, help='concurrent requests the bot may make (default: 1)')
+    parser.add_argument('--content-limit', type=int, default=50,
+                        help='page texts the mock API fits in one response (default: 50)')
+    parser.add_argument('--bot', action='store_true', help='give the benchmark account apihighlimits')
+    parser.add_argument('--gzip', action='store_true', help='have the mock API compress responses')
+    parser.add_argument('--json', default=None, help='also write the results to this file as JSON')
+    # used internally to run a single case in a child process
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--url', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.url, args.workers)))
+        return
+
+    cases = args.cases.split(',')
+    for case in cases:
+        if case not in CASES:
+            parser.error(f'unknown case {case}')
+
+    print(f'{"case":<24} {"corpus":>8} {"seconds":>9} {"requests":>9} {"req/s":>9} {"pages/s":>10} {"RSS MiB":>9}')
+    results = []
+    for result in run_suite([int(s) for s in args.sizes.split(',')], cases, args.latency, args.workers,
+                            args.content_limit, args.bot, args.gzip):
+        print(format_result(result), flush=True)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
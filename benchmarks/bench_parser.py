@@ -0,0 +1,176 @@
+# MIT License
+#
+# Copyright (c) 2024 Chris Fisher ("cdfisher")
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""bench_parser.py - (c) 2024 Chris Fisher ("cdfisher")
+Micro-benchmarks of the parameter and heading searches the gallery scan runs on every page, over synthetic Infobox
+Item pages. Two sweeps are run: one over the number of infobox versions (1-50) at a fixed page size, and one over page
+size at a fixed number of versions. Each reports the time per call and the peak memory allocated during a call.
+
+    python benchmarks/bench_parser.py --json parser.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mwparserfromhell  # noqa: E402
+
+from parser_utils import first_matching_heading, get_all_param_versions, get_matching_param_versions  # noqa: E402
+from rule_scan import HISTORIC_GALLERIES, match_page  # noqa: E402
+
+VERSION_COUNTS = (1, 2, 5, 10, 20, 50)
+FILLER_SECTIONS = (0, 10, 50, 200)
+
+
+def infobox_page(rng: random.Random, versions: int, filler: int = 0) -> str:
+    """Builds a synthetic item page. Some release values are comma-separated lists and some carry HTML comments; the
+    page ends with a historical gallery after `filler` sections of prose, so the heading search has to pass them all.
+
+    :param rng: Random number generator to draw from.
+    :type rng: random.Random
+
+    :param versions: Number of infobox versions; 1 gives an unversioned infobox.
+    :type versions: int
+
+    :param filler: Number of prose sections between the infobox and the gallery, defaults to 0.
+    :type filler: int
+
+    :return: The page's wikitext.
+    :rtype: str
+    """
+    def release():
+        value = f'[[{rng.randint(1, 28)} May]] [[{rng.randint(2001, 2023)}]]'
+        if rng.random() < 0.2:
+            value += f', [[{rng.randint(1, 28)} June]] [[{rng.randint(2001, 2023)}]]'
+        if rng.random() < 0.2:
+            value += ' <!-- ' + rng.choice(['approximate', 'see talk page', 'update 2005']) + ' -->'
+        return value
+
+    lines = ['{{Infobox Item']
+    if versions == 1:
+        lines.append(f'|release = {release()}')
+    else:
+        for v in range(1, versions + 1):
+            lines.append(f'|version{v} = Version {v}')
+        # a shared default for some versions, as real infoboxes often have
+        lines.append(f'|release = {release()}')
+        for v in range(1, versions + 1):
+            if rng.random() < 0.8:
+                lines.append(f'|release{v} = {release()}')
+            lines.append(f'|image{v} = [[File:Item {v}.png]]')
+    lines.append('|members = Yes\n|tradeable = No\n}}')
+    for n in range(filler):
+        lines.append(f'==Section {n}==')
+        lines.append("Some text with a [[link]] and {{Template|arg}} in it. " * rng.randint(3, 10))
+    lines.append('==Gallery (historical)==\n<gallery>\nFile:Item old.png|Old\n</gallery>')
+    return '\n'.join(lines)
+
+
+def measure(func, args: list, min_seconds: float = 0.2) -> tuple:
+    """Times func over every item of args, repeating until at least min_seconds have passed, then measures the peak
+    memory allocated by a single call with tracemalloc.
+
+    :param func: Function to call with each of args.
+
+    :param args: Arguments to call func with, one at a time.
+    :type args: list
+
+    :param min_seconds: Minimum time to spend timing, defaults to 0.2.
+    :type min_seconds: float
+
+    :return: (seconds per call, mean peak bytes allocated per call)
+    :rtype: tuple
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for arg in args:
+            func(arg)
+        calls += len(args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            break
+
+    tracemalloc.start()
+    peaks = 0
+    for arg in args:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        func(arg)
+        peaks += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return elapsed / calls, peaks / len(args)
+
+
+def run_point(versions: int, filler: int, pages: int, seed: int = 0):
+    """Benchmarks each function over `pages` synthetic pages of one shape.
+
+    :return: Generator of result dicts.
+    """
+    rng = random.Random(seed)
+    texts = [infobox_page(rng, versions, filler) for _ in range(pages)]
+    trees = [mwparserfromhell.parse(text) for text in texts]
+    templates = [tree.filter_templates()[0] for tree in trees]
+    size = sum(len(text) for text in texts) // pages
+
+    cases = [
+        ('parse', mwparserfromhell.parse, texts),
+        ('get_all_param_versions', lambda t: get_all_param_versions(t, 'release'), templates),
+        ('get_matching_param_versions', lambda t: get_matching_param_versions(t, 'release', r"200[0-7]"), templates),
+        ('first_matching_heading', lambda tree: first_matching_heading(
+            [str(h.title) for h in tree.filter_headings(recursive=True)], r"historic"), trees),
+        ('match_page', lambda tree: match_page([HISTORIC_GALLERIES], 'Page', tree), trees),
+    ]
+    for name, func, args in cases:
+        seconds, peak = measure(func, args)
+        yield {'function': name, 'versions': versions, 'chars': size, 'seconds': seconds, 'peak_bytes': peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the gallery scan\'s parameter and heading searches')
+    parser.add_argument('--pages', type=int, default=20, help='synthetic pages per data point (default: 20)')
+    parser.add_argument('--json', default=None, help='also write the results to this file as JSON')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"function":<28} {"versions":>8} {"chars":>8} {"us/call":>10} {"peak KiB":>9}')
+    # versions sweep at a small page size, then size sweep at a typical number of versions
+    points = [(v, 0) for v in VERSION_COUNTS] + [(5, f) for f in FILLER_SECTIONS if f]
+    for versions, filler in points:
+        for result in run_point(versions, filler, args.pages):
+            print(f'{result["function"]:<28} {result["versions"]:>8} {result["chars"]:>8} '
+                  f'{result["seconds"] * 1e6:>10.1f} {result["peak_bytes"] / 1024:>9.1f}', flush=True)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,466 @@
+# MIT License
+#
+# Copyright (c) 2024 Chris Fisher ("cdfisher")
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""mock_api.py - (c) 2024 Chris Fisher ("cdfisher")
+Local stand-in for a MediaWiki api.php, serving a synthetic corpus of Infobox Item pages (or the pages of an XML
+export) so that Mwbot can be benchmarked without touching the live wiki.
+
+Supports the login flow, meta=tokens/userinfo, list=categorymembers/allpages, prop=transcludedin/info/revisions/
+categories/templates/imageinfo by title or page ID, and generator=transcludedin/allpages with props, all with
+continuation. As on a real wiki, only `content_limit` page texts (or file uploads) fit in one response; the rest follow
+with rvcontinue before the generator moves on.
+
+Run directly to serve on a local port, e.g. `python benchmarks/mock_api.py --pages 5000 --latency 0.02`; the first
+line printed is the API URL.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dump_reader import iter_dump  # noqa: E402
+
+TEMPLATE = 'Template:Infobox Item'
+CATEGORY = 'Category:Items'
+NAMESPACES = {'User': 2, 'File': 6, 'Template': 10, 'Category': 14}
+
+# Continuation parameter of each prop that can be split over several responses
+PROP_CONTINUE = {'revisions': 'rvcontinue', 'categories': 'clcontinue', 'templates': 'tlcontinue',
+                 'transcludedin': 'ticontinue', 'imageinfo': 'iicontinue'}
+
+CATEGORY_RE = re.compile(r'\[\[\s*Category\s*:\s*([^\]|]+)')
+TEMPLATE_RE = re.compile(r'\{\{\s*([^{}|#:<\n]+?)\s*(?:\||\}\})')
+FILE_RE = re.compile(r'File:[^|\]\n]+')
+
+# "max" for list/generator limits and multi-value parameters, for normal and apihighlimits users
+LIMITS = {False: (500, 50), True: (5000, 500)}
+
+
+def normalize_title(title: str) -> str:
+    """Normalizes a title the way the API does for the cases Mwbot sends, e.g. `Template: Infobox_Item`.
+
+    :param title: Title as given in a request.
+    :type title: str
+
+    :return: The normalized title.
+    :rtype: str
+    """
+    title = ' '.join(title.replace('_', ' ').split())
+    prefix, sep, rest = title.partition(':')
+    if sep and prefix in NAMESPACES:
+        return f'{prefix}:{rest.strip()[:1].upper()}{rest.strip()[1:]}'
+    return title[:1].upper() + title[1:]
+
+
+def synthetic_text(rng: random.Random, i: int) -> str:
+    """Builds the wikitext of a synthetic item page: an Infobox Item with 1-6 versions and releases from 2001-2023,
+    some filler prose, and for about a quarter of pages a historical gallery.
+
+    :param rng: Random number generator to draw from.
+    :type rng: random.Random
+
+    :param i: Page number, used in file names.
+    :type i: int
+
+    :return: The page's wikitext.
+    :rtype: str
+    """
+    versions = rng.randint(1, 6)
+    lines = ['{{Infobox Item']
+    if versions == 1:
+        lines.append(f'|release = [[{rng.randint(1, 28)} May]] [[{rng.randint(2001, 2023)}]]')
+        lines.append(f'|image = [[File:Item {i}.png]]')
+    else:
+        for v in range(1, versions + 1):
+            lines.append(f'|version{v} = Version {v}')
+        for v in range(1, versions + 1):
+            lines.append(f'|release{v} = [[{rng.randint(1, 28)} May]] [[{rng.randint(2001, 2023)}]]'
+                         + (' <!-- approximate -->' if rng.random() < 0.1 else ''))
+        for v in range(1, versions + 1):
+            lines.append(f'|image{v} = [[File:Item {i} {v}.png]]')
+    lines.append('|members = ' + rng.choice(['Yes', 'No']))
+    lines.append('|tradeable = ' + rng.choice(['Yes', 'No']))
+    lines.append('}}')
+    lines.append(f"The '''item {i}''' is an item. " * rng.randint(1, 40))
+    lines.append('==Changes==')
+    lines.append('{{Subject changes table}}\n' + '{{Subject changes|date=1 May 2010|change=Something changed.}}\n'
+                 * rng.randint(0, 10) + '{{Subject changes footer}}')
+    if rng.random() < 0.25:
+        lines.append('==Gallery (historical)==')
+        lines.append('<gallery>')
+        for n in range(rng.randint(1, 8)):
+            lines.append(f'File:Item {i} {n} historical.png|Image {n}')
+        lines.append('</gallery>')
+    lines.append(f'[[{CATEGORY}]]')
+    return '\n'.join(lines)
+
+
+def synthetic_pages(n: int, seed: int = 0):
+    """Generates a corpus of n pages transcluding Infobox Item, one in ten of them outside of mainspace.
+
+    :param n: Number of pages.
+    :type n: int
+
+    :param seed: Seed for the random number generator, so that the same corpus is served every time, defaults to 0.
+    :type seed: int
+
+    :return: Generator of (pageid, title, wikitext) tuples.
+    """
+    rng = random.Random(seed)
+    for i in range(1, n + 1):
+        title = f'Item {i}' if i % 10 else f'User:Someone/Item {i}'
+        yield i, title, synthetic_text(rng, i)
+
+
+class MockWiki:
+    """Answers API requests from an in-memory corpus, every page of which transcludes Infobox Item and is in
+    Category:Items.
+
+    :param pages: (pageid, title, wikitext) tuples making up the corpus.
+
+    :param latency: Seconds each request takes to answer, defaults to 0.
+    :type latency: float
+
+    :param content_limit: Number of page texts that fit in one response, defaults to 50.
+    :type content_limit: int
+
+    :param bot: Whether the account has apihighlimits, raising "max" limits and batch sizes, defaults to False.
+    :type bot: bool
+    """
+
+    def __init__(self, pages, latency: float = 0.0, content_limit: int = 50, bot: bool = False):
+        self.latency = latency
+        self.content_limit = content_limit
+        self.bot = bot
+        self.list_limit, self.batch_limit = LIMITS[bot]
+        self.pages = []
+        self.by_id = {}
+        self.by_title = {}
+        for pageid, title, text in pages:
+            prefix = title.partition(':')[0] if ':' in title else ''
+            page = {'pageid': pageid, 'ns': NAMESPACES.get(prefix, 0), 'title': title, 'text': text,
+                    'revid': 100000 + pageid, 'timestamp': '2024-01-01T00:00:00Z',
+                    'categories': sorted({normalize_title(f'Category:{c}') for c in CATEGORY_RE.findall(text)}),
+                    'templates': sorted({normalize_title(f'Template:{t}') for t in TEMPLATE_RE.findall(text)})}
+            self.pages.append(page)
+            self.by_id[pageid] = page
+            self.by_title[title] = page
+        self.pages.sort(key=lambda page: page['pageid'])
+        # every file used has a File: page with one to three uploads, which can be looked up (by title or pageid) but
+        # aren't part of the corpus lists run over
+        for title in sorted({normalize_title(name) for page in self.pages for name in FILE_RE.findall(page['text'])}):
+            if title in self.by_title:
+                continue
+            pageid = 1000000 + len(self.by_id)
+            uploads = [{'timestamp': f'20{10 + n:02}-01-01T00:00:00Z', 'user': 'Uploader', 'size': 1000 + n,
+                        'width': 32, 'height': 32} for n in range(1 + pageid % 3)][::-1]
+            page = {'pageid': pageid, 'ns': 6, 'title': title, 'text': '', 'revid': 100000 + pageid,
+                    'timestamp': '2024-01-01T00:00:00Z', 'imageinfo': uploads}
+            self.by_id[pageid] = page
+            self.by_title[title] = page
+        # the template itself can be looked up, but isn't one of the pages it's transcluded in
+        self.by_title[TEMPLATE] = {'pageid': 0, 'ns': 10, 'title': TEMPLATE, 'text': '{{{release|}}}',
+                                   'revid': 100000, 'timestamp': '2024-01-01T00:00:00Z'}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def limit(self, params: dict, key: str) -> int:
+        value = params.get(key, '10')
+        return self.list_limit if value == 'max' else min(int(value), self.list_limit)
+
+    def members(self, params: dict, prefix: str) -> list:
+        """Pages a list or generator runs over, filtered by its `<prefix>namespace` parameter if given."""
+        namespace = params.get(prefix + 'namespace', '*')
+        if namespace == '*':
+            return self.pages
+        wanted = {int(ns) for ns in str(namespace).split('|')}
+        return [page for page in self.pages if page['ns'] in wanted]
+
+    def page_slice(self, params: dict, prefix: str, limit_key: str):
+        """One batch of a continued list: (pages, continue value for the next batch or None)."""
+        members = self.members(params, prefix)
+        start = int(params.get(prefix + 'continue', 0))
+        limit = self.limit(params, limit_key)
+        end = start + limit
+        return members[start:end], (str(end) if end < len(members) else None)
+
+    def handle(self, params: dict) -> dict:
+        """Answers one request.
+
+        :param params: Request parameters, as single strings.
+        :type params: dict
+
+        :return: The response object.
+        :rtype: dict
+        """
+        with self.lock:
+            self.requests += 1
+        action = params.get('action')
+        if action == 'login':
+            ok = params.get('lgtoken') == 'logintoken+\\'
+            return {'login': {'result': 'Success' if ok else 'Failed', 'reason': 'Invalid token'}}
+        if action != 'query':
+            return {'error': {'code': 'unsupported', 'info': f'{action} is not supported by the mock API'}}
+
+        res = {'batchcomplete': ''}
+        query = {}
+        meta = params.get('meta')
+        if meta == 'tokens':
+            key = 'logintoken' if params.get('type') == 'login' else 'csrftoken'
+            query['tokens'] = {key: key.replace('token', 'token+\\')}
+        elif meta == 'userinfo':
+            query['userinfo'] = {'id': 1, 'name': 'Bench', 'rights': ['apihighlimits'] if self.bot else []}
+
+        listname = params.get('list')
+        if listname in ('categorymembers', 'allpages'):
+            prefix = 'cm' if listname == 'categorymembers' else 'ap'
+            pages, cont = self.page_slice(params, prefix, prefix + 'limit')
+            query[listname] = [{'pageid': p['pageid'], 'ns': p['ns'], 'title': p['title']} for p in pages]
+            if cont is not None:
+                res['continue'] = {prefix + 'continue': cont, 'continue': '-||'}
+
+        generator = params.get('generator')
+        if generator in ('transcludedin', 'allpages'):
+            prefix = 'gti' if generator == 'transcludedin' else 'gap'
+            pages, cont = self.page_slice(params, prefix, prefix + 'limit')
+            if cont is not None:
+                res['continue'] = {prefix + 'continue': cont, 'continue': prefix + 'continue||'}
+            self.prop(params, pages, query, res, generator_prefix=prefix)
+        elif 'pageids' in params or 'titles' in params:
+            self.prop(params, self.requested(params, query, res), query, res)
+
+        res['query'] = query
+        return res
+
+    def requested(self, params: dict, query: dict, res: dict) -> list:
+        """Pages named by the pageids/titles parameter, truncated to the batch limit as the API does."""
+        key = 'pageids' if 'pageids' in params else 'titles'
+        values = params[key].split('|')
+        if len(values) > self.batch_limit:
+            res['warnings'] = {'main': {'*': f'Too many values supplied for parameter "{key}". '
+                                              f'The limit is {self.batch_limit}.'}}
+            values = values[:self.batch_limit]
+        pages = []
+        for value in values:
+            if key == 'pageids':
+                page = self.by_id.get(int(value), {'pageid': int(value), 'missing': ''})
+            else:
+                title = normalize_title(value)
+                if title != value:
+                    query.setdefault('normalized', []).append({'from': value, 'to': title})
+                page = self.by_title.get(title, {'ns': 0, 'title': title, 'missing': ''})
+            pages.append(page)
+        return pages
+
+    def prop(self, params: dict, pages: list, query: dict, res: dict, generator_prefix: str = None):
+        """Fills in query.pages for pages with the requested props. Props that don't fit in one response continue
+        separately, as on a real wiki; the batch (and the generator) only moves on once all of them are done."""
+        # pages are answered in pageid order, which is also the order props are continued in
+        pages = sorted(pages, key=lambda page: page.get('pageid', 0))
+        props = [prop for prop in params.get('prop', '').split('|') if prop]
+        # when continuing a batch, props that already finished aren't run again
+        if any(PROP_CONTINUE.get(prop) in params for prop in props):
+            props = [prop for prop in props if prop not in PROP_CONTINUE or PROP_CONTINUE[prop] in params]
+        cont = {}
+        output = {}
+        for n, page in enumerate(pages):
+            if 'missing' in page:
+                output[str(page.get('pageid', -1 - n))] = page
+                continue
+            entry = {'pageid': page['pageid'], 'ns': page['ns'], 'title': page['title']}
+            if 'info' in props:
+                entry.update({'lastrevid': page['revid'], 'length': len(page['text']), 'touched': page['timestamp']})
+            output[str(page['pageid'])] = entry
+
+        if 'revisions' in props:
+            self.revisions(params, pages, output, cont)
+        if 'categories' in props:
+            self.prop_items(params, pages, output, 'categories', 'cl', 14, cont)
+        if 'templates' in props:
+            self.prop_items(params, pages, output, 'templates', 'tl', 10, cont)
+        if 'imageinfo' in props:
+            self.imageinfo(params, pages, output, cont)
+        if 'transcludedin' in props and len(pages) == 1 and pages[0]['title'] == TEMPLATE:
+            members, ticontinue = self.page_slice(params, 'ti', 'tilimit')
+            output['0']['transcludedin'] = [
+                {'pageid': p['pageid'], 'ns': p['ns'], 'title': p['title']} for p in members]
+            if ticontinue is not None:
+                cont['ticontinue'] = ticontinue
+
+        if cont:
+            # this batch isn't finished, so a generator stays where it is
+            cont['continue'] = '||'
+            if generator_prefix and generator_prefix + 'continue' in params:
+                cont[generator_prefix + 'continue'] = params[generator_prefix + 'continue']
+            res['continue'] = cont
+            res.pop('batchcomplete', None)
+        query['pages'] = output
+
+    def revisions(self, params: dict, pages: list, output: dict, cont: dict):
+        """Adds the latest revision of each page, fitting at most content_limit page texts in a response."""
+        rvprop = params.get('rvprop', 'ids|timestamp|flags|comment|user').split('|')
+        rvstart = int(params.get('rvcontinue', 0))
+        served = 0
+        for page in pages:
+            if 'missing' in page or page['pageid'] < rvstart:
+                # missing, or sent in an earlier response of this batch
+                continue
+            revision = {}
+            if 'ids' in rvprop:
+                revision.update({'revid': page['revid'], 'parentid': page['revid'] - 1})
+            if 'timestamp' in rvprop:
+                revision['timestamp'] = page['timestamp']
+            if 'content' in rvprop:
+                if served == self.content_limit:
+                    # no more room in this response; continue from here
+                    cont['rvcontinue'] = str(page['pageid'])
+                    return
+                revision['*'] = page['text']
+                served += 1
+            output[str(page['pageid'])]['revisions'] = [revision]
+
+    def imageinfo(self, params: dict, pages: list, output: dict, cont: dict):
+        """Adds the latest `iilimit` uploads of each file, newest first, fitting at most content_limit uploads in a
+        response."""
+        iilimit = self.limit(params, 'iilimit') if 'iilimit' in params else 1
+        iiprop = params.get('iiprop', 'timestamp|user').split('|')
+        keys = [key for key in ('timestamp', 'user') if key in iiprop]
+        if 'size' in iiprop:
+            keys += ['size', 'width', 'height']
+        start_page, start_item = (int(x) for x in params.get('iicontinue', '0|0').split('|'))
+        count = 0
+        for page in pages:
+            if 'imageinfo' not in page or page['pageid'] < start_page:
+                continue
+            uploads = page['imageinfo'][:iilimit]
+            for i in range(start_item if page['pageid'] == start_page else 0, len(uploads)):
+                if count == self.content_limit:
+                    cont['iicontinue'] = f"{page['pageid']}|{i}"
+                    return
+                output[str(page['pageid'])].setdefault('imageinfo', []).append(
+                    {key: uploads[i][key] for key in keys})
+                count += 1
+
+    def prop_items(self, params: dict, pages: list, output: dict, prop: str, prefix: str, ns: int, cont: dict):
+        """Adds a list prop such as categories, at most `<prefix>limit` items per response over all pages."""
+        limit = self.limit(params, prefix + 'limit')
+        start_page, start_item = (int(x) for x in params.get(prefix + 'continue', '0|0').split('|'))
+        count = 0
+        for page in pages:
+            if 'missing' in page or page['pageid'] < start_page:
+                continue
+            items = page.get(prop, [])
+            for i in range(start_item if page['pageid'] == start_page else 0, len(items)):
+                if count == limit:
+                    cont[prefix + 'continue'] = f"{page['pageid']}|{i}"
+                    return
+                output[str(page['pageid'])].setdefault(prop, []).append({'ns': ns, 'title': items[i]})
+                count += 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    wiki = None
+    gzip = False
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, params):
+        if self.wiki.latency:
+            time.sleep(self.wiki.latency)
+        body = json.dumps(self.wiki.handle({k: v[-1] for k, v in params.items()})).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if self.gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.respond(parse_qs(self.rfile.read(length).decode()))
+
+
+def serve(wiki: MockWiki, host: str = '127.0.0.1', port: int = 0, compress: bool = False):
+    """Serves a MockWiki from a background thread.
+
+    :param wiki: The wiki to serve.
+    :type wiki: MockWiki
+
+    :param host: Address to listen on, defaults to localhost.
+    :type host: str
+
+    :param port: Port to listen on, defaults to any free port.
+    :type port: int
+
+    :param compress: Whether to gzip responses for clients accepting it, defaults to False.
+    :type compress: bool
+
+    :return: (server, API URL). Call `server.shutdown()` to stop it.
+    """
+    handler = type('WikiHandler', (Handler,), {'wiki': wiki, 'gzip': compress})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_port}/api.php'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a mock MediaWiki API for benchmarking Mwbot')
+    parser.add_argument('--pages', type=int, default=1000, help='size of the synthetic corpus (default: 1000)')
+    parser.add_argument('--dump', default=None, help='serve the pages of this XML export instead')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request (default: 0)')
+    parser.add_argument('--content-limit', type=int, default=50,
+                        help='page texts that fit in one response (default: 50)')
+    parser.add_argument('--bot', action='store_true', help='give the account apihighlimits')
+    parser.add_argument('--gzip', action='store_true', help='compress responses')
+    parser.add_argument('--port', type=int, default=0, help='port to listen on (default: any free port)')
+    args = parser.parse_args()
+
+    pages = iter_dump(args.dump, namespaces=None) if args.dump else synthetic_pages(args.pages)
+    wiki = MockWiki(pages, latency=args.latency, content_limit=args.content_limit, bot=args.bot)
+    server, url = serve(wiki, port=args.port, compress=args.gzip)
+    print(url, flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
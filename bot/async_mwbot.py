@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+import asyncio
+import json
+import time
+from collections import deque
+from urllib.parse import urlencode
+
+import aiohttp
+import mwparserfromhell
+
+import bot.mwbot as mw
+from bot.metrics import Metrics
+
+
+# asyncio counterpart to mw.RateLimiter; everything runs on one event loop so no lock is needed
+class AsyncRateLimiter():
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.paused_until = 0
+
+    async def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1
+        wait = max(-self.tokens / self.rate, self.paused_until - now, 0)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+# Async iterator over a continued query. Runs the same Query specs as Continuation and shares its state, so
+# params, limits and resume tokens behave exactly as they do for the synchronous bot.
+class AsyncContinuation(mw.BaseContinuation):
+
+    async def responses(self):
+        while not self.done:
+            res = mw.check_response(await self.bot.query(self.request_params()))
+            yield res
+            self.advance(res)
+
+    async def __aiter__(self):
+        if self.exhausted():
+            return
+        async for res in self.responses():
+            for item in self.items(res):
+                yield item
+            if self.exhausted():
+                return
+
+            if self.bot.debug:
+                print(f'{self.name} query:', self.n)
+
+
+# Mwbot on asyncio/aiohttp, for running many wiki jobs in one event loop. Methods mirror Mwbot, but requests
+# return decoded JSON rather than Response objects, and paging helpers are async iterators/generators.
+#
+#     async with AsyncMwbot(creds_file='creds.file', workers=8) as bot:
+#         async for page in bot.iter_categorymembers('Category:Items'):
+#             ...
+class AsyncMwbot():
+
+    # workers bounds the number of open connections; further requests queue on the connector
+    def __init__(self, creds_file='creds.file', debug=False, api_url=mw.API_URL, workers=10, rate=None,
+                 maxlag=None, max_retries=5, user_agent=None):
+        self.debug = debug
+        self.api_url = api_url
+        self.user_agent = user_agent
+        self.workers = workers
+        self.limiter = AsyncRateLimiter(rate, burst=workers) if rate else None
+        self.maxlag = maxlag
+        self.max_retries = max_retries
+        self.metrics = Metrics()
+        with open(creds_file) as f:
+            self.username, self.password = f.read().split('\n')
+        self.session = None
+        self.token = None
+        self._batch_size = None
+
+    async def __aenter__(self):
+        await self.login()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def login(self):
+        if self.session is None:
+            headers = {'Accept-Encoding': mw.ACCEPT_ENCODING}
+            if self.user_agent:
+                headers['User-Agent'] = self.user_agent
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.workers),
+                                                 cookie_jar=aiohttp.CookieJar(unsafe=True), headers=headers)
+        r1 = await self.request('GET', mw.LOGIN_TOKEN_PARAMS)
+        r2 = await self.request('POST', mw.login_params(self.username, self.password, r1))
+        mw.check_login(r2)
+        r3 = await self.request('GET', mw.CSRF_TOKEN_PARAMS)
+        self.token = r3['query']['tokens']['csrftoken']
+        return self.session, self.token
+
+    async def request(self, method, params):
+        if self.maxlag is not None and 'maxlag' not in params:
+            params = dict(params, maxlag=self.maxlag)
+        kwargs = {'params': params} if method == 'GET' else {'data': params}
+
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                await self.limiter.acquire()
+            start = time.perf_counter()
+            async with self.session.request(method, self.api_url, **kwargs) as res:
+                body = await res.read()
+                self.metrics.request(params, time.perf_counter() - start, len(urlencode(params)),
+                                     res.content_length or len(body))
+                wait = mw.retry_after(res.status, res.headers)
+                if wait is not None and attempt == self.max_retries:
+                    raise mw.APIError(res.headers.get('MediaWiki-API-Error', f'HTTP {res.status}'),
+                                      f'still refused after {self.max_retries} retries')
+                if wait is None:
+                    start = time.perf_counter()
+                    data = json.loads(body)
+                    self.metrics.decode(params, time.perf_counter() - start)
+                    return data
+
+            self.metrics.retry(params, wait, mw.lagged(res.headers))
+            if self.debug:
+                print(f'Backing off {wait}s (HTTP {res.status}, attempt {attempt + 1})')
+            if self.limiter:
+                self.limiter.pause(wait)
+            await asyncio.sleep(wait)
+
+    async def query(self, params):
+        return await self.request('GET', params)
+
+    async def parse(self, title):
+        return mwparserfromhell.parse(mw.parse_text(await self.query(mw.Mwbot.parse_params(title))))
+
+    async def post(self, summary, title, text, baserevid=None, basetimestamp=None, starttimestamp=None):
+        return await self.request('POST', mw.edit_params(self.token, summary, title, text, baserevid,
+                                                         basetimestamp, starttimestamp))
+
+    async def move(self, reason, from_page, to_page, make_redirect=True):
+        return await self.request('POST', mw.move_params(self.token, reason, from_page, to_page, make_redirect))
+
+    async def delete(self, reason, title):
+        return await self.request('POST', mw.delete_params(self.token, reason, title))
+
+    async def hide_log(self, logid, hide, reason):
+        return await self.request('POST', mw.hide_log_params(self.token, logid, hide, reason))
+
+    async def revisions(self, ids, cont=None):
+        return await self.query(mw.Mwbot.revisions_params(ids, cont))
+
+    async def batch_size(self):
+        if self._batch_size is None:
+            params = {
+                "action": "query",
+                "format": "json",
+                "meta": "userinfo",
+                "uiprop": "rights",
+            }
+            res = mw.check_response(await self.query(params))
+            rights = res["query"]["userinfo"].get("rights", [])
+            self._batch_size = mw.BATCH_LIMIT_BOT if 'apihighlimits' in rights else mw.BATCH_LIMIT
+        return self._batch_size
+
+    async def _revision_batch(self, batch):
+        found = []
+        res = await self.revisions(batch)
+        while True:
+            for page in mw.check_response(res).get("query", {}).get("pages", {}).values():
+                if 'revisions' in page:
+                    found.append((page['pageid'], page['title'], page['revisions'][0]['*']))
+            if "continue" not in res:
+                return found
+            res = await self.revisions(batch, cont=res["continue"])
+
+    # Yields (pageid, title, wikicode) for each page in ids, with several batches in flight at once
+    async def page_texts(self, ids, batch_size=None):
+        ids = list(ids)
+        if batch_size is None:
+            batch_size = await self.batch_size()
+        pending = deque()
+        for i in range(0, len(ids), batch_size):
+            pending.append(asyncio.ensure_future(self._revision_batch(ids[i:i + batch_size])))
+            if len(pending) < 2 * self.workers:
+                continue
+            for pageid, title, text in await pending.popleft():
+                yield pageid, title, mwparserfromhell.parse(text)
+        while pending:
+            for pageid, title, text in await pending.popleft():
+                yield pageid, title, mwparserfromhell.parse(text)
+
+    # Paging helpers run Mwbot's query specs as async iterators
+    def iter_categorymembers(self, titles, limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.categorymembers_query(titles), limit, cont)
+
+    async def categorymembers(self, titles):
+        return [m async for m in self.iter_categorymembers(titles)]
+
+    def iter_prefixsearch(self, prefix, limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.prefixsearch_query(prefix), limit, cont)
+
+    async def prefixsearch(self, prefix):
+        return [m async for m in self.iter_prefixsearch(prefix)]
+
+    def iter_prefixindex(self, prefix, ns='0', limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.prefixindex_query(prefix, ns), limit, cont)
+
+    async def prefixindex(self, prefix, ns='0'):
+        return [m async for m in self.iter_prefixindex(prefix, ns)]
+
+    def iter_transcludedin(self, titles, namespace='*', limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.transcludedin_query(titles, namespace), limit, cont)
+
+    async def transcludedin(self, titles, namespace='*'):
+        return [m async for m in self.iter_transcludedin(titles, namespace)]
+
+    def transcludedin_pages(self, titles, limit=None, cont=None, namespace='*'):
+        return AsyncContinuation(self, mw.Mwbot.transcludedin_pages_query(titles, namespace), limit, cont)
+
+    async def transcludedin_generator(self, titles):
+        return {page['pageid']: page async for page in self.transcludedin_pages(titles)}
+
+    def iter_allpages(self, ns=0, apfilterredir="nonredirects", limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.allpages_query(ns, apfilterredir), limit, cont)
+
+    async def allpages(self, ns=0, apfilterredir="nonredirects"):
+        return [m async for m in self.iter_allpages(ns, apfilterredir)]
+
+    def iter_allpages_generator(self, ns=0, limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.allpages_generator_query(ns), limit, cont)
+
+    async def allpages_generator(self, ns=0):
+        return {page['pageid']: page async for page in self.iter_allpages_generator(ns)}
+
+    def iter_backlinks(self, pageid, limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.backlinks_query(pageid), limit, cont)
+
+    async def backlinks(self, pageid):
+        return [m async for m in self.iter_backlinks(pageid)]
+
+    def iter_links(self, pageids, limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.links_query(pageids), limit, cont)
+
+    async def links(self, pageids):
+        return [m async for m in self.iter_links(pageids)]
+
+    def iter_thanks(self, limit=None, cont=None):
+        return AsyncContinuation(self, mw.Mwbot.thanks_query(), limit, cont)
+
+    async def thanks(self):
+        return [m async for m in self.iter_thanks()]
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+import bot.mwbot as mw
+
+# Journal statuses meaning a job needs no more work on later runs
+DONE = ('saved', 'unchanged')
+
+
+# What a journal record is matched on: the title, a hash of the submitted text and the summary, so a job is only
+# skipped if the very same edit was already made, not just any edit to the same page
+def job_key(title, text, summary):
+    return title, hashlib.sha1(text.encode('utf-8')).hexdigest(), summary
+
+
+# Queue of edits pushed in bulk. Base revisions are fetched in batches, edits that wouldn't change a page are
+# skipped, and the rest are posted at a steady rate against their base revision, so anything edited or deleted in
+# the meantime is reported as a conflict instead of being overwritten. Every outcome is appended to a journal;
+# identical jobs the journal has as saved or unchanged are skipped, so an interrupted run can just be started again.
+# Give each job its own journal.
+#
+#     queue = EditQueue(bot, 'infobox_fixes.journal', rate=0.2)
+#     for title, text in changes:
+#         queue.submit(title, text, 'Fixing infobox')
+#     print(queue.run())
+class EditQueue():
+
+    # journal is the path of the job's journal; rate is the maximum number of edits per second
+    def __init__(self, bot, journal, rate=None):
+        self.bot = bot
+        self.journal = journal
+        self.limiter = mw.RateLimiter(rate) if rate else None
+        self.jobs = {}
+
+    # Queues an edit replacing the text of `title`; submitting the same title again replaces the earlier job
+    def submit(self, title, text, summary):
+        self.jobs[title] = (text, summary)
+
+    # job_key()s of the jobs the journal records as needing no further work
+    def done(self):
+        done = set()
+        if not os.path.exists(self.journal):
+            return done
+        with open(self.journal, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line cut short by an interrupted run
+                    continue
+                if record.get('status') in DONE and 'sha1' in record:
+                    done.add((record['title'], record['sha1'], record['summary']))
+        return done
+
+    # Maps each of titles to its current (revid, timestamp, text), or None if the page doesn't exist, along with
+    # the server time the revisions were read at. Titles the server reports neither revisions for nor as missing
+    # (e.g. invalid titles) are left out. Raises mw.APIError if the query fails, as editing without base revisions
+    # would overwrite pages blindly.
+    def base_revisions(self, titles):
+        params = {
+            "action": "query",
+            "format": "json",
+            "prop": "revisions",
+            "rvprop": "content|ids|timestamp",
+            "curtimestamp": 1,
+            "titles": '|'.join(titles),
+        }
+        bases = {}
+        # never from the response cache: edits are based on these revisions
+        res = mw.check_response(self.bot.query_json(params, cached=False))
+        start = res.get("curtimestamp")
+        while True:
+            query = res.get("query", {})
+            # map titles back to how they were submitted, e.g. "foo_bar" -> "Foo bar"
+            submitted = {n['to']: n['from'] for n in query.get("normalized", [])}
+            for page in query.get("pages", {}).values():
+                title = submitted.get(page['title'], page['title'])
+                # pages without revisions here are missing, invalid, or have their content in a later continuation
+                if 'revisions' in page:
+                    revision = page['revisions'][0]
+                    bases[title] = revision['revid'], revision['timestamp'], revision['*']
+                elif 'missing' in page:
+                    bases[title] = None
+
+            if "continue" not in res:
+                break
+            res = mw.check_response(self.bot.query_json(dict(params, **res["continue"]), cached=False))
+
+        return bases, start
+
+    def edit(self, title, base, starttimestamp):
+        text, summary = self.jobs[title]
+        # MediaWiki drops trailing whitespace on save, so it doesn't count as a change
+        if base is not None and base[2].rstrip() == text.rstrip():
+            return {'title': title, 'status': 'unchanged'}
+
+        revid, timestamp = (base[0], base[1]) if base is not None else (None, None)
+        for attempt in range(self.bot.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+            res = self.bot.post(summary, title, text, baserevid=revid, basetimestamp=timestamp,
+                                starttimestamp=starttimestamp).json()
+            code = res.get('error', {}).get('code')
+            if code != 'ratelimited' or attempt == self.bot.max_retries:
+                break
+            # the account's edit rate limit was hit; back off harder each time
+            time.sleep(mw.DEFAULT_RETRY_AFTER * 2 ** attempt)
+
+        if code is not None:
+            status = 'conflict' if code in ('editconflict', 'pagedeleted') else 'error'
+            return {'title': title, 'status': status, 'code': code}
+        edit = res.get('edit', {})
+        if edit.get('result') != 'Success':
+            return {'title': title, 'status': 'error', 'code': edit.get('result')}
+        return {'title': title, 'status': 'saved', 'revid': edit.get('newrevid')}
+
+    # Posts every queued edit not already done according to the journal, returning a count of each outcome
+    def run(self):
+        done = self.done()
+        pending = [title for title, (text, summary) in self.jobs.items() if job_key(title, text, summary) not in done]
+        counts = Counter(skipped=len(self.jobs) - len(pending))
+        batch_size = self.bot.batch_size()
+
+        with open(self.journal, 'a') as journal:
+            for i in range(0, len(pending), batch_size):
+                batch = pending[i:i + batch_size]
+                bases, start = self.base_revisions(batch)
+                for title in batch:
+                    if title in bases:
+                        record = self.edit(title, bases[title], start)
+                    else:
+                        # with no base revision and the page not known to be missing, an edit could overwrite it
+                        record = {'title': title, 'status': 'error', 'code': 'nobaserevision'}
+                    _, record['sha1'], record['summary'] = job_key(title, *self.jobs[title])
+                    journal.write(json.dumps(record) + '\n')
+                    journal.flush()
+                    counts[record['status']] += 1
+
+                    if self.bot.debug:
+                        print(f"{record['status']}: {title}")
+
+        return counts
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+import json
+import threading
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Parameters naming the API modules a query request runs, used to tell requests apart
+MODULE_PARAMS = ('generator', 'list', 'prop', 'meta')
+
+
+# (action, module) a request is tallied under, e.g. ('query', 'generator=transcludedin prop=revisions')
+def request_tag(params):
+    action = str(params.get('action', ''))
+    module = ' '.join(f'{key}={params[key]}' for key in MODULE_PARAMS if key in params)
+    return action, module
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Thread-safe tallies of every request a bot makes, tagged by API action and module: a latency histogram,
+# bytes sent and received, retries, maxlag waits, continuation pages and JSON decoding time. Written out at the end
+# of a run as a JSON summary or in the Prometheus text format (e.g. for node_exporter's textfile collector).
+class Metrics():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def _stat(self, tag):
+        stat = self.stats.get(tag)
+        if stat is None:
+            stat = self.stats[tag] = {
+                'requests': 0,
+                'seconds': 0.0,
+                'buckets': [0] * len(BUCKETS),
+                'bytes_sent': 0,
+                'bytes_received': 0,
+                'retries': 0,
+                'maxlag_waits': 0,
+                'maxlag_seconds': 0.0,
+                'continuations': 0,
+                'decode_seconds': 0.0,
+            }
+        return stat
+
+    # One HTTP round trip, retried or not
+    def request(self, params, seconds, sent, received):
+        with self.lock:
+            stat = self._stat(request_tag(params))
+            stat['requests'] += 1
+            stat['seconds'] += seconds
+            stat['bytes_sent'] += sent
+            stat['bytes_received'] += received
+            # follow-up requests of a continued query carry the previous response's "continue" object
+            if 'continue' in params:
+                stat['continuations'] += 1
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stat['buckets'][i] += 1
+                    break
+
+    # A response the server asked us to retry after `seconds`; lagged if the reason was replication lag
+    def retry(self, params, seconds, lagged):
+        with self.lock:
+            stat = self._stat(request_tag(params))
+            stat['retries'] += 1
+            if lagged:
+                stat['maxlag_waits'] += 1
+                stat['maxlag_seconds'] += seconds
+
+    # Time taken to decode a response's JSON
+    def decode(self, params, seconds):
+        with self.lock:
+            self._stat(request_tag(params))['decode_seconds'] += seconds
+
+    # Stats for each (action, module), sorted by the time spent on them
+    def summary(self):
+        with self.lock:
+            rows = []
+            for (action, module), stat in self.stats.items():
+                row = {'action': action, 'module': module}
+                row.update(stat)
+                row['buckets'] = dict(zip(BUCKETS, stat['buckets']))
+                row['mean_seconds'] = stat['seconds'] / stat['requests'] if stat['requests'] else 0.0
+                rows.append(row)
+        return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self):
+        rows = self.summary()
+        lines = [
+            '# HELP mwbot_request_seconds Time taken by API requests',
+            '# TYPE mwbot_request_seconds histogram',
+        ]
+        for row in rows:
+            labels = f'action="{_escape(row["action"])}",module="{_escape(row["module"])}"'
+            total = 0
+            for bound, count in row['buckets'].items():
+                total += count
+                lines.append(f'mwbot_request_seconds_bucket{{{labels},le="{bound}"}} {total}')
+            lines.append(f'mwbot_request_seconds_bucket{{{labels},le="+Inf"}} {row["requests"]}')
+            lines.append(f'mwbot_request_seconds_sum{{{labels}}} {row["seconds"]}')
+            lines.append(f'mwbot_request_seconds_count{{{labels}}} {row["requests"]}')
+
+        counters = [
+            ('bytes_sent', 'Request bytes sent'),
+            ('bytes_received', 'Response bytes received, as sent on the wire'),
+            ('retries', 'Requests retried at the server\'s request'),
+            ('maxlag_waits', 'Retries caused by replication lag'),
+            ('maxlag_seconds', 'Seconds spent waiting out replication lag'),
+            ('continuations', 'Follow-up requests made for continued queries'),
+            ('decode_seconds', 'Seconds spent decoding JSON responses'),
+        ]
+        for key, description in counters:
+            lines.append(f'# HELP mwbot_{key}_total {description}')
+            lines.append(f'# TYPE mwbot_{key}_total counter')
+            for row in rows:
+                labels = f'action="{_escape(row["action"])}",module="{_escape(row["module"])}"'
+                lines.append(f'mwbot_{key}_total{{{labels}}} {row[key]}')
+        return '\n'.join(lines) + '\n'
+
+    # Writes Prometheus text to .prom files and a JSON summary to anything else
+    def write(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus() if path.endswith('.prom') else self.to_json())
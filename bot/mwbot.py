@@ -1,57 +1,482 @@
 #!/usr/bin/env python
 # -*- coding: latin-1 -*-
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import mwparserfromhell
 import urllib3
+from requests.adapters import HTTPAdapter
+
+from bot.metrics import Metrics
+from bot.respcache import ResponseCache
+from bot.revcache import RevisionCache
 
 urllib3.disable_warnings()
 
 API_URL = 'https://oldschool.runescape.wiki/api.php'
 
+# Maximum number of titles/pageids per request, for normal and apihighlimits users
+BATCH_LIMIT = 50
+BATCH_LIMIT_BOT = 500
+
+# Advertise brotli only when urllib3 can decode it, i.e. a brotli package is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+# Seconds to wait on a 429/503 or maxlag response that doesn't say how long to back off for
+DEFAULT_RETRY_AFTER = 5
+
+
+# Token bucket allowing `rate` requests per second on average, with bursts of up to `burst`. Shared by all
+# threads using a bot, so the overall request rate stays within bounds however many requests are in flight.
+class RateLimiter():
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # tokens may go negative: each caller reserves its slot and sleeps until it comes up
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate, self.paused_until - now, 0)
+        if wait > 0:
+            time.sleep(wait)
+
+    # Hold off every caller for `seconds`, e.g. when the server reports replication lag
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+# Whether a response was refused because of replication lag exceeding maxlag
+def lagged(headers):
+    return headers.get('MediaWiki-API-Error') == 'maxlag' or 'X-Database-Lag' in headers
+
+
+# Seconds the server asked us to wait before retrying, or None if the response can be used
+def retry_after(status, headers):
+    if status not in (429, 503) and not lagged(headers):
+        return None
+    try:
+        return max(int(headers.get('Retry-After', DEFAULT_RETRY_AFTER)), 1)
+    except ValueError:
+        # Retry-After may also be an HTTP date; not worth parsing for a backoff
+        return DEFAULT_RETRY_AFTER
+
+
+# A request the API refused, with the error code it gave (or the HTTP status, for a request still refused after
+# every retry)
+class APIError(RuntimeError):
+
+    def __init__(self, code, info=''):
+        super().__init__(f'{code}: {info}' if info else str(code))
+        self.code = code
+        self.info = info
+
+
+# Raises an APIError if a decoded response is an error, so a failed batch can't pass for an empty one; returns res
+def check_response(res):
+    if 'error' in res:
+        raise APIError(res['error'].get('code', 'unknown'), res['error'].get('info', ''))
+    return res
+
+
+# Bytes sent for a requests.Response's request, and received for its body as it was on the wire (still compressed)
+def response_bytes_sent(res):
+    body = res.request.body or ''
+    return len(res.request.url) + len(body)
+
+
+def response_bytes_received(res):
+    try:
+        return int(res.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return len(res.content)
+
+
+# Wikitext from a parse_params response, or '' if the page doesn't exist
+def parse_text(res):
+    for page in res.get("query", {}).get("pages", {}).values():
+        if 'revisions' in page:
+            return page['revisions'][0]['*']
+    return ''
+
+
+# Requests making up the login flow, shared by Mwbot and AsyncMwbot
+LOGIN_TOKEN_PARAMS = {
+    'format': 'json',
+    'action': 'query',
+    'meta': 'tokens',
+    'type': 'login',
+}
+
+CSRF_TOKEN_PARAMS = {
+    'format': 'json',
+    'action': 'query',
+    'meta': 'tokens',
+}
+
+
+def login_params(username, password, token_res):
+    return {
+        'format': 'json',
+        'action': 'login',
+        'lgname': username,
+        'lgpassword': password,
+        'lgtoken': token_res['query']['tokens']['logintoken'],
+    }
+
+
+def check_login(res):
+    if res['login']['result'] != 'Success':
+        raise RuntimeError(res['login']['reason'])
+
+
+# Write actions, shared by Mwbot and AsyncMwbot; token is the session's CSRF token
+# basetimestamp/starttimestamp let the server detect edit conflicts and deletions since the base revision
+def edit_params(token, summary, title, text, baserevid=None, basetimestamp=None, starttimestamp=None):
+    data = {
+        'format': 'json',
+        'action': 'edit',
+        'assert': 'user',
+        'bot': 1,
+        'minor': 1,
+        'text': text,
+        'summary': summary,
+        'title': title,
+        'token': token,
+    }
+    if baserevid:
+        data['baserevid'] = baserevid
+    if basetimestamp:
+        data['basetimestamp'] = basetimestamp
+    if starttimestamp:
+        data['starttimestamp'] = starttimestamp
+
+    return data
+
+
+def move_params(token, reason, from_page, to_page, make_redirect=True):
+    params = {
+        'action': 'move',
+        'format': 'json',
+        'from': from_page,
+        'to': to_page,
+        'reason': reason,
+        'token': token,
+    }
+
+    if not make_redirect:
+        params['noredirect'] = 'true'
+
+    return params
+
+
+def delete_params(token, reason, title):
+    return {
+        'action': 'delete',
+        'format': 'json',
+        'title': title,
+        'reason': reason,
+        'token': token,
+    }
+
+
+def hide_log_params(token, logid, hide, reason):
+    return {
+        'action': 'revisiondelete',
+        'format': 'json',
+        'type': 'logging',
+        'reason': reason,
+        'hide': hide,
+        'ids': logid,
+        'token': token,
+    }
+
+
+# Extractors mapping a query response to the items it holds
+def _list_items(key):
+    return lambda res: res.get("query", {}).get(key, [])
+
+
+def _pages_with_revisions(res):
+    # generator+revisions queries return some pages without content; it arrives in a later rvcontinue batch
+    return [page for page in res.get("query", {}).get("pages", {}).values() if 'revisions' in page]
+
+
+def _all_pages(res):
+    return list(res.get("query", {}).get("pages", {}).values())
+
+
+# Merges the pages of a prop query response into pages (keyed by pageid), extending lists of prop items such as
+# categories or templates that were split over several continuations
+def _merge_pages(pages, res):
+    for key, page in res.get("query", {}).get("pages", {}).items():
+        merged = pages.setdefault(key, {})
+        for prop, value in page.items():
+            if prop in merged and isinstance(value, list) and prop != 'revisions':
+                merged[prop].extend(value)
+            else:
+                merged[prop] = value
+
+
+def _prop_items(key):
+    def extract(res):
+        items = []
+        for page in res.get("query", {}).get("pages", {}).values():
+            items.extend(page.get(key, []))
+        return items
+    return extract
+
+
+# Key of the resume token holding the number of items of its batch already consumed
+OFFSET_KEY = '_offset'
+
+
+# A paging query: its params, the extractor mapping a response to its items, the parameter limiting the items per
+# response (if any) and a name for debug output. Built by Mwbot's *_query staticmethods, and run by Continuation
+# or async_mwbot.AsyncContinuation.
+Query = namedtuple('Query', ['params', 'extract', 'limit_param', 'name'], defaults=(None, 'query'))
+
+
+# State of a continued query, shared by the synchronous and asyncio iterators over it: the request to make next,
+# and the resume token. Iteration stops after `limit` items if given. `cont` is the resume token: after stopping
+# early, passing it to a new iterator restarts just after the last item consumed. A token taken partway through a
+# batch is the batch's "continue" object plus the number of its items consumed (and the batch size it was fetched
+# with), so the batch is fetched again and the items already consumed are skipped.
+class BaseContinuation():
+
+    def __init__(self, bot, query, limit=None, cont=None):
+        self.bot = bot
+        self.params = dict(query.params)
+        self.extract = query.extract
+        self.limit = limit
+        self.cont = cont
+        self.limit_param = query.limit_param
+        self.name = query.name
+        self.done = False
+        self.n = 0
+        # no point asking the server for more than we'll consume
+        if limit is not None and self.limit_param is not None and limit < 500:
+            self.params[self.limit_param] = max(limit, 1)
+
+    def request_params(self):
+        params = dict(self.params)
+        if self.cont:
+            params.update(self.cont)
+            params.pop(OFFSET_KEY, None)
+        return params
+
+    def advance(self, res):
+        if "continue" in res:
+            self.cont = res["continue"]
+        else:
+            self.cont = None
+            self.done = True
+
+    # Yields the items of the response to the current request that haven't been consumed yet, up to the limit,
+    # keeping self.cont pointing just past the last item handed out
+    def items(self, res):
+        start = self.cont or {}
+        skip = start.get(OFFSET_KEY, 0)
+        token = {key: value for key, value in start.items() if key != OFFSET_KEY}
+        if self.limit_param in self.params:
+            token.setdefault(self.limit_param, self.params[self.limit_param])
+
+        items = self.extract(res)
+        for idx in range(skip, len(items)):
+            if self.limit is not None and self.n >= self.limit:
+                return
+            self.n += 1
+            if idx == len(items) - 1:
+                self.advance(res)
+            else:
+                self.cont = dict(token, **{OFFSET_KEY: idx + 1})
+            yield items[idx]
+
+    def exhausted(self):
+        return self.limit is not None and self.n >= self.limit
+
+
+# Lazily pages through a continued query on a Mwbot, merging each response's whole "continue" object into the
+# next request
+class Continuation(BaseContinuation):
+
+    # Yields each raw response, advancing self.cont once the response has been handed out
+    def responses(self):
+        while not self.done:
+            res = check_response(self.bot.query_json(self.request_params()))
+            yield res
+            self.advance(res)
+
+    def __iter__(self):
+        if self.exhausted():
+            return
+        for res in self.responses():
+            yield from self.items(res)
+            if self.exhausted():
+                return
+
+            if self.bot.debug:
+                print(f'{self.name} query:', self.n)
+
 
 class Mwbot():
 
     # debug determines if there should be extra status messages
-    def __init__(self, creds_file='creds.file', debug=False, api_url=API_URL):
+    # workers is the number of requests map_requests/query_many keep in flight at once
+    # rate caps requests per second across all workers; maxlag is passed with every request per bot policy
+    # cache is the path of a RevisionCache database page_texts uses to skip downloading unchanged pages
+    # user_agent is sent with every request, including the login ones
+    # metrics tallies latency, bytes, retries and continuations of every request; see bot/metrics.py
+    # response_cache keeps repeated read-only queries in memory: True for a default ResponseCache, or a
+    # ResponseCache to set its size and TTLs (see bot/respcache.py)
+    def __init__(self, creds_file='creds.file', debug=False, api_url=API_URL, workers=1, rate=None, maxlag=None,
+                 max_retries=5, cache=None, user_agent=None, response_cache=None):
         self.debug = debug
         self.api_url = api_url
+        self.user_agent = user_agent
+        self.workers = workers
+        self.limiter = RateLimiter(rate, burst=workers) if rate else None
+        self.maxlag = maxlag
+        self.max_retries = max_retries
+        self.metrics = Metrics()
         with open(creds_file) as f:
             self.username, self.password = f.read().split('\n')
         self.session, self.token = self.login()
+        self._batch_size = None
+        self.cache = RevisionCache(cache) if cache else None
+        self.responses = ResponseCache() if response_cache is True else response_cache or None
 
-    def login(self):
+    # All requests go through one keep-alive session, with a pooled connection available for each worker and
+    # compressed responses negotiated, so there's no per-request handshake and wikitext travels compressed
+    def new_session(self):
         session = requests.Session()
-        r1 = session.get(self.api_url, params={
-            'format': 'json',
-            'action': 'query',
-            'meta': 'tokens',
-            'type': 'login',
-        }, verify=False)
-
-        r2 = session.post(self.api_url, data={
-            'format': 'json',
-            'action': 'login',
-            'lgname': self.username,
-            'lgpassword': self.password,
-            'lgtoken': r1.json()['query']['tokens']['logintoken'],
-        })
-        if r2.json()['login']['result'] != 'Success':
-            raise RuntimeError(r2.json()['login']['reason'])
-
-        r3 = session.get(self.api_url, params={
-            'format': 'json',
-            'action': 'query',
-            'meta': 'tokens',
-        })
+        # every request goes to the one API host, so a single pool sized to the worker count is all that's needed
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.workers, 10))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        if self.user_agent:
+            session.headers['User-Agent'] = self.user_agent
+        return session
+
+    def login(self):
+        session = self.new_session()
+        r1 = session.get(self.api_url, params=LOGIN_TOKEN_PARAMS, verify=False)
+
+        r2 = session.post(self.api_url, data=login_params(self.username, self.password, r1.json()))
+        check_login(r2.json())
+
+        r3 = session.get(self.api_url, params=CSRF_TOKEN_PARAMS)
         return session, r3.json()['query']['tokens']['csrftoken']
 
-    def query(self, params):
-        res = self.session.get(self.api_url, params=params)
+    # Served from the response cache when one is set and holds a fresh response to the same params; cached=False
+    # always goes to the server, for reads a write is about to be based on
+    def query(self, params, cached=True):
+        if self.responses is None or not cached or not self.responses.cacheable(params):
+            return self.request('GET', params)
+
+        res = self.responses.get(params)
+        if res is None:
+            res = self.request('GET', params)
+            # API errors come back as 200s, flagged by a header
+            if res.ok and 'MediaWiki-API-Error' not in res.headers:
+                self.responses.put(params, res)
+        return res
+
+    # Drops cached responses a write to titles may have made stale
+    def invalidate(self, titles=(), modules=()):
+        if self.responses is not None:
+            self.responses.invalidate(titles, modules)
+
+    # query, returning the decoded JSON; decoding time is tallied in metrics separately from the request itself
+    def query_json(self, params, cached=True):
+        res = self.query(params, cached)
+        start = time.perf_counter()
+        data = res.json()
+        self.metrics.decode(params, time.perf_counter() - start)
+        return data
+
+    # Sends a request, waiting on the rate limiter and retrying while the server reports lag or overload.
+    # Retrying POSTs is safe: maxlag, 429 and 503 responses all mean the action wasn't carried out.
+    def request(self, method, params):
+        if self.maxlag is not None and 'maxlag' not in params:
+            params = dict(params, maxlag=self.maxlag)
+
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+            start = time.perf_counter()
+            if method == 'GET':
+                res = self.session.get(self.api_url, params=params)
+            else:
+                res = self.session.post(self.api_url, data=params)
+            self.metrics.request(params, time.perf_counter() - start, response_bytes_sent(res),
+                                 response_bytes_received(res))
+            wait = retry_after(res.status_code, res.headers)
+            if wait is None:
+                break
+            if attempt == self.max_retries:
+                raise APIError(res.headers.get('MediaWiki-API-Error', f'HTTP {res.status_code}'),
+                               f'still refused after {self.max_retries} retries')
+
+            self.metrics.retry(params, wait, lagged(res.headers))
+            if self.debug:
+                print(f'Backing off {wait}s (HTTP {res.status_code}, attempt {attempt + 1})')
+            if self.limiter:
+                self.limiter.pause(wait)
+            else:
+                time.sleep(wait)
+
         return res
 
+    # Runs func over args with up to self.workers calls in flight, yielding results in order
+    def map_requests(self, func, args):
+        if self.workers <= 1:
+            for arg in args:
+                yield func(arg)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for arg in args:
+                pending.append(pool.submit(func, arg))
+                # bound the readahead so results don't pile up ahead of a slow consumer
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def query_many(self, params_list):
+        return self.map_requests(self.query, params_list)
+
+    # Fetched through the API on the bot's session rather than from /w/<title>?action=raw
     def parse(self, title):
-        url = "https://oldschool.runescape.wiki/w/" + str(title) + "?action=raw"
-        data = {
+        return mwparserfromhell.parse(parse_text(self.query_json(self.parse_params(title))))
+
+    @staticmethod
+    def parse_params(title):
+        return {
             "action": "query",
             "prop": "revisions",
             "rvlimit": 1,
@@ -59,72 +484,41 @@ class Mwbot():
             "format": "json",
             "titles": title
         }
-        req = self.session.get(url, data=data)
-        print(req)
-        text = req.text
-        return mwparserfromhell.parse(text)
-
-    def post(self, summary, title, text, baserevid=None):
-        data = {
-            'format': 'json',
-            'action': 'edit',
-            'assert': 'user',
-            'bot': 1,
-            'minor': 1,
-            'text': text,
-            'summary': summary,
-            'title': title,
-            'token': self.token,
-        }
-        if baserevid:
-            data['baserevid'] = baserevid
 
-        r4 = self.session.post(self.api_url, data=data)
+    # basetimestamp/starttimestamp let the server detect edit conflicts and deletions since the base revision
+    def post(self, summary, title, text, baserevid=None, basetimestamp=None, starttimestamp=None):
+        r4 = self.request('POST', edit_params(self.token, summary, title, text, baserevid, basetimestamp,
+                                              starttimestamp))
+        self.invalidate([title])
 
         # print(r4.headers)
 
         return r4
 
     def move(self, reason, from_page, to_page, make_redirect=True):
-        params = {
-            'action': 'move',
-            'format': 'json',
-            'from': from_page,
-            'to': to_page,
-            'reason': reason,
-            'token': self.token,
-        }
-
-        if not make_redirect:
-            params['noredirect'] = 'true'
-
-        return self.session.post(self.api_url, data=params)
+        res = self.request('POST', move_params(self.token, reason, from_page, to_page, make_redirect))
+        self.invalidate([from_page, to_page])
+        return res
 
     def delete(self, reason, title):
-        params = {
-            'action': 'delete',
-            'format': 'json',
-            'title': title,
-            'reason': reason,
-            'token': self.token,
-        }
-
-        return self.session.post(self.api_url, data=params)
+        res = self.request('POST', delete_params(self.token, reason, title))
+        self.invalidate([title])
+        return res
 
+    # The log entry's page isn't known from its id, so every cached log query is dropped
     def hide_log(self, logid, hide, reason):
-        params = {
-            'action': 'revisiondelete',
-            'format': 'json',
-            'type': 'logging',
-            'reason': reason,
-            'hide': hide,
-            'ids': logid,
-            'token': self.token,
-        }
-
-        return self.session.post(self.api_url, data=params)
+        res = self.request('POST', hide_log_params(self.token, logid, hide, reason))
+        self.invalidate(modules=['list=logevents'])
+        return res
 
     def categorymembers(self, titles):
+        return list(self.iter_categorymembers(titles))
+
+    def iter_categorymembers(self, titles, limit=None, cont=None):
+        return Continuation(self, self.categorymembers_query(titles), limit, cont)
+
+    @staticmethod
+    def categorymembers_query(titles):
         params = {
             "action": "query",
             "format": "json",
@@ -132,21 +526,18 @@ class Mwbot():
             "cmlimit": "max",
             "cmtitle": titles,
         }
-        res = self.query(params).json()
-        output = res["query"]["categorymembers"]
-        while "continue" in res:
-            params["cmcontinue"] = res["continue"]["cmcontinue"]
-            res = self.query(params).json()
-            output.extend(res["query"]["categorymembers"])
-
-            if self.debug:
-                print('Category query:', len(output))
-
-        return output
+        return Query(params, _list_items("categorymembers"), "cmlimit", 'Category')
 
     # NOTE: PrefixSearch is not the same as PrefixIndex.
     # You probably don't want this ever.
     def prefixsearch(self, prefix):
+        return list(self.iter_prefixsearch(prefix))
+
+    def iter_prefixsearch(self, prefix, limit=None, cont=None):
+        return Continuation(self, self.prefixsearch_query(prefix), limit, cont)
+
+    @staticmethod
+    def prefixsearch_query(prefix):
         params = {
             "action": "query",
             "format": "json",
@@ -154,19 +545,16 @@ class Mwbot():
             "pslimit": "max",
             "pssearch": prefix,
         }
-        res = self.query(params).json()
-        output = res["query"]["prefixsearch"]
-        while "continue" in res:
-            params["psoffset"] = res["continue"]["psoffset"]
-            res = self.query(params).json()
-            output.extend(res["query"]["prefixsearch"])
+        return Query(params, _list_items("prefixsearch"), "pslimit", 'Prefixsearch')
 
-            if self.debug:
-                print('Prefixsearch query:', len(output))
+    def prefixindex(self, prefix, ns='0'):
+        return list(self.iter_prefixindex(prefix, ns))
 
-        return output
+    def iter_prefixindex(self, prefix, ns='0', limit=None, cont=None):
+        return Continuation(self, self.prefixindex_query(prefix, ns), limit, cont)
 
-    def prefixindex(self, prefix, ns='0'):
+    @staticmethod
+    def prefixindex_query(prefix, ns='0'):
         params = {
             "action": "query",
             "format": "json",
@@ -175,20 +563,16 @@ class Mwbot():
             "apnamespace": str(ns),
             "apprefix": prefix,
         }
-        res = self.query(params).json()
-        print(res)
-        output = res["query"]["allpages"]
-        while "continue" in res:
-            params["apcontinue"] = res["continue"]["apcontinue"]
-            res = self.query(params).json()
-            output.extend(res["query"]["allpages"])
+        return Query(params, _list_items("allpages"), "aplimit", 'PrefixIndex')
 
-            if self.debug:
-                print('PrefixIndex query:', len(output))
+    def transcludedin(self, titles, namespace='*'):
+        return list(self.iter_transcludedin(titles, namespace))
 
-        return output
+    def iter_transcludedin(self, titles, namespace='*', limit=None, cont=None):
+        return Continuation(self, self.transcludedin_query(titles, namespace), limit, cont)
 
-    def transcludedin(self, titles, namespace='*'):
+    @staticmethod
+    def transcludedin_query(titles, namespace='*'):
         params = {
             "action": "query",
             "format": "json",
@@ -198,58 +582,110 @@ class Mwbot():
             "titles": titles,
             "tinamespace": namespace,
         }
-        res = self.query(params).json()
-        page_output = list(res["query"]["pages"].values())[0]
-        if "transcludedin" not in page_output:
-            return []
-        output = page_output["transcludedin"]
-        while "continue" in res:
-            params["ticontinue"] = res["continue"]["ticontinue"]
-            res = self.query(params).json()
-            pages = res["query"]["pages"]
-            new_output = list(pages.values())[0]["transcludedin"]
-            output.extend(new_output)
+        return Query(params, _prop_items("transcludedin"), "tilimit", 'transcludedin')
 
-            if self.debug:
-                print('transcludedin query:', len(output))
+    def transcludedin_generator(self, titles):
+        output = {}
+        for page in self.transcludedin_pages(titles):
+            output[page['pageid']] = page
 
         return output
 
-    def transcludedin_generator(self, titles):
+    # Streaming form of transcludedin_generator, yielding each page with its content as soon as its
+    # continuation batch arrives instead of buffering the whole result
+    # namespace is filtered by the server, so pages in other namespaces aren't downloaded at all
+    def transcludedin_pages(self, titles, limit=None, cont=None, namespace='*'):
+        return Continuation(self, self.transcludedin_pages_query(titles, namespace), limit, cont)
+
+    @staticmethod
+    def transcludedin_pages_query(titles, namespace='*'):
         params = {
             "action": "query",
             "format": "json",
             "generator": "transcludedin",
             "gtilimit": "max",
+            "gtinamespace": namespace,
             "titles": titles,
             "prop": "revisions",
-            "rvprop": "content",
+            "rvprop": "content|ids",
         }
-        res = self.query(params).json()
-        output = {}
-        pages = res["query"]["pages"]
-        for pageid, page in pages.items():
-            if 'revisions' in page:
-                output[page['pageid']] = page
-
-        while "continue" in res:
-            # print('CONTINUE',res["continue"])
-            if "gticontinue" in res["continue"]:
-                params["gticontinue"] = res["continue"]["gticontinue"]
-            if "rvcontinue" in res["continue"]:
-                params["rvcontinue"] = res["continue"]["rvcontinue"]
-            res = self.query(params).json()
-            pages = res["query"]["pages"]
-            for pageid, page in pages.items():
-                if 'revisions' in page:
-                    output[page['pageid']] = page
+        return Query(params, _pages_with_revisions, name='transcludedin')
 
-            if self.debug:
-                print('transcludedin query:', len(output))
-
-        return output
+    # Title, namespace, redirect status and latest revid (prop=info), categories, templates used and, with
+    # content=True, current wikitext, fetched together so a job needs one request plan rather than one per prop
+    @staticmethod
+    def metadata_params(content=True):
+        return {
+            "action": "query",
+            "format": "json",
+            "prop": "info|categories|templates|revisions",
+            "cllimit": "max",
+            "tllimit": "max",
+            "rvprop": "ids|timestamp|content" if content else "ids|timestamp",
+        }
 
-    def revisions(self, ids):
+    # Runs a prop query to the end of its batch, merging the pieces of each page's props spread over
+    # continuations, and returns the complete pages
+    def _merged_batch(self, params):
+        pages = {}
+        while True:
+            res = check_response(self.query_json(params))
+            _merge_pages(pages, res)
+            if "continue" not in res:
+                return list(pages.values())
+            params = dict(params, **res["continue"])
+
+    # Yields the complete metadata of each page in ids (see metadata_params), fetching batch_size pages per
+    # request, with batches in flight concurrently when self.workers > 1
+    def iter_page_metadata(self, ids, content=True, batch_size=None):
+        return self._iter_batches(self.metadata_params(content), 'pageids', ids, batch_size)
+
+    # iter_page_metadata for pages given by title
+    def iter_title_metadata(self, titles, content=True, batch_size=None):
+        return self._iter_batches(self.metadata_params(content), 'titles', titles, batch_size)
+
+    # Yields each page titled with just its current revision's ids and content, for when nothing else of
+    # iter_title_metadata's is needed
+    def iter_title_revisions(self, titles, batch_size=None):
+        params = {
+            "action": "query",
+            "format": "json",
+            "prop": "revisions",
+            "rvprop": "ids|content",
+        }
+        return self._iter_batches(params, 'titles', titles, batch_size)
+
+    # Runs a prop query over values (pageids or titles, as key says) batch_size at a time, with batches in flight
+    # concurrently when self.workers > 1, yielding each complete page as its batch finishes
+    def _iter_batches(self, params, key, values, batch_size=None):
+        values = [str(value) for value in values]
+        if batch_size is None:
+            batch_size = self.batch_size()
+        batches = [dict(params, **{key: '|'.join(values[i:i + batch_size])})
+                   for i in range(0, len(values), batch_size)]
+        for pages in self.map_requests(self._merged_batch, batches):
+            yield from pages
+
+    # Yields the complete metadata of each page transcluding titles in namespace, which the server filters on, so
+    # nothing is downloaded for pages in other namespaces. A generator batch's props may be spread over several
+    # responses; its pages are only yielded once the server marks the batch complete.
+    def iter_transcludedin_metadata(self, titles, namespace=0, content=True):
+        params = dict(self.metadata_params(content), generator="transcludedin", gtilimit="max",
+                      gtinamespace=namespace, titles=titles)
+        pages = {}
+        for res in Continuation(self, Query(params, None, name='transcludedin metadata')).responses():
+            _merge_pages(pages, res)
+            if "batchcomplete" in res or "continue" not in res:
+                yield from pages.values()
+                pages = {}
+
+    def revisions(self, ids, cont=None):
+        return self.query_json(self.revisions_params(ids, cont))
+
+    @staticmethod
+    def revisions_params(ids, cont=None):
+        if type(ids) == type([]):
+            ids = '|'.join(str(i) for i in ids)
         params = {
             "action": "query",
             "prop": "revisions",
@@ -257,7 +693,96 @@ class Mwbot():
             "format": "json",
             "pageids": ids
         }
-        return self.query(params).json()
+        if cont:
+            params.update(cont)
+        return params
+
+    # Number of pageids/titles the API accepts in one request for this account
+    def batch_size(self):
+        if self._batch_size is None:
+            params = {
+                "action": "query",
+                "format": "json",
+                "meta": "userinfo",
+                "uiprop": "rights",
+            }
+            rights = check_response(self.query_json(params))["query"]["userinfo"].get("rights", [])
+            self._batch_size = BATCH_LIMIT_BOT if 'apihighlimits' in rights else BATCH_LIMIT
+        return self._batch_size
+
+    @staticmethod
+    def info_params(ids):
+        if type(ids) == type([]):
+            ids = '|'.join(str(i) for i in ids)
+        return {
+            "action": "query",
+            "prop": "info",
+            "format": "json",
+            "pageids": ids,
+        }
+
+    # Yields (pageid, title, wikicode) for each page in ids, fetching batch_size pages per request
+    # With parse=False the raw wikitext is yielded instead, e.g. to hand off to other processes
+    # With revids=True each tuple also carries the revid of the revision the text belongs to
+    def page_texts(self, ids, batch_size=None, parse=True, revids=False):
+        ids = list(ids)
+        if batch_size is None:
+            batch_size = self.batch_size()
+        if self.cache is not None:
+            # serve unchanged pages from the cache; only the rest need downloading
+            ids = yield from self._cached_page_texts(ids, batch_size, parse, revids)
+
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        done = 0
+        # batches are fetched concurrently when self.workers > 1
+        for batch, res in zip(batches, self.map_requests(self.revisions, batches)):
+            while True:
+                pages = check_response(res).get("query", {}).get("pages", {})
+                for pageid, page in pages.items():
+                    # missing pages, or pages whose content is deferred to the next continuation
+                    if 'revisions' not in page:
+                        continue
+                    revision = page['revisions'][0]
+                    if self.cache is not None:
+                        self.cache.put(page['pageid'], revision['revid'], page['title'], revision['*'])
+                    text = revision['*']
+                    record = page['pageid'], page['title'], mwparserfromhell.parse(text) if parse else text
+                    yield record + (revision['revid'],) if revids else record
+
+                # large batches can exceed the API's result size and spill into continuations
+                if "continue" not in res:
+                    break
+                res = self.revisions(batch, cont=res["continue"])
+
+            if self.cache is not None:
+                self.cache.commit()
+            done += len(batch)
+            if self.debug:
+                print('page_texts query:', done, 'of', len(ids))
+
+    # Yields cached pages whose stored revid is still current, returning the ids that need fetching.
+    # Only current revids are requested here (prop=info), which is far cheaper than downloading content.
+    def _cached_page_texts(self, ids, batch_size, parse=True, revids=False):
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        current = {}
+        for res in self.map_requests(self.query_json, [self.info_params(batch) for batch in batches]):
+            for page in check_response(res).get("query", {}).get("pages", {}).values():
+                if 'lastrevid' in page:
+                    current[page['pageid']] = page['lastrevid'], page['title']
+
+        stored = self.cache.revids(current.keys())
+        stale = []
+        for pageid, (revid, title) in current.items():
+            if stored.get(pageid) != revid:
+                stale.append(pageid)
+                continue
+            text = self.cache.get(pageid)[2]
+            record = pageid, title, mwparserfromhell.parse(text) if parse else text
+            yield record + (revid,) if revids else record
+
+        if self.debug:
+            print('page_texts cache:', len(current) - len(stale), 'unchanged,', len(stale), 'to fetch')
+        return stale
 
     def revisions_by_title(self, titles):
         params = {
@@ -269,9 +794,16 @@ class Mwbot():
             "rvslots": "*",
             "titles": titles
         }
-        return self.query(params).json()
+        return self.query_json(params)
 
     def allpages(self, ns=0, apfilterredir="nonredirects"):
+        return list(self.iter_allpages(ns, apfilterredir))
+
+    def iter_allpages(self, ns=0, apfilterredir="nonredirects", limit=None, cont=None):
+        return Continuation(self, self.allpages_query(ns, apfilterredir), limit, cont)
+
+    @staticmethod
+    def allpages_query(ns=0, apfilterredir="nonredirects"):
         params = {
             "action": "query",
             "format": "json",
@@ -280,22 +812,20 @@ class Mwbot():
             "apfilterredir": apfilterredir,
             "apnamespace": ns,
         }
-        res = self.query(params).json()
-        if 'query' not in res:
-            return []
-        output = res["query"]["allpages"]
-        while "continue" in res:
-            params["apcontinue"] = res["continue"]["apcontinue"]
-            res = self.query(params).json()
-            pages = res["query"]["allpages"]
-            output.extend(pages)
+        return Query(params, _list_items("allpages"), "aplimit", 'allpages')
 
-            if self.debug:
-                print('allpages query:', len(output))
+    def allpages_generator(self, ns=0):
+        output = {}
+        for page in self.iter_allpages_generator(ns):
+            output[page['pageid']] = page
 
         return output
 
-    def allpages_generator(self, ns=0):
+    def iter_allpages_generator(self, ns=0, limit=None, cont=None):
+        return Continuation(self, self.allpages_generator_query(ns), limit, cont)
+
+    @staticmethod
+    def allpages_generator_query(ns=0):
         params = {
             "action": "query",
             "format": "json",
@@ -306,29 +836,7 @@ class Mwbot():
             "prop": "revisions",
             "rvprop": "content",
         }
-        res = self.query(params).json()
-        output = {}
-        pages = res["query"]["pages"]
-        for pageid, page in pages.items():
-            if 'revisions' in page:
-                output[page['pageid']] = page
-
-        while "continue" in res:
-            # print('CONTINUE',res["continue"])
-            if "gapcontinue" in res["continue"]:
-                params["gapcontinue"] = res["continue"]["gapcontinue"]
-            if "rvcontinue" in res["continue"]:
-                params["rvcontinue"] = res["continue"]["rvcontinue"]
-            res = self.query(params).json()
-            pages = res["query"]["pages"]
-            for pageid, page in pages.items():
-                if 'revisions' in page:
-                    output[page['pageid']] = page
-
-            if self.debug:
-                print('allpages query:', len(output))
-
-        return output
+        return Query(params, _pages_with_revisions, name='allpages')
 
     def imageinfo(self, pageids):
         params = {
@@ -338,9 +846,10 @@ class Mwbot():
             "iiprop": "size|user|timestamp",
             "pageids": pageids,
         }
-        res = self.query(params).json()
+        res = self.query_json(params)
         return res
 
+    # One request, so at most batch_size() titles; see iter_imageinfo for more
     def imageinfo_by_title(self, titles):
         if type(titles) == type([]):
             titles = '|'.join(titles)
@@ -351,10 +860,31 @@ class Mwbot():
             "iiprop": "size|user|timestamp",
             "titles": titles,
         }
-        res = self.query(params).json()
+        res = self.query_json(params)
         return res
 
+    # Yields each of titles' File: page with its "imageinfo" list, fetching batch_size files per request (with
+    # batches in flight concurrently when self.workers > 1, within the rate limit) and following iicontinue.
+    # history=True lists every upload of each file, newest first, instead of only the current one. Files that
+    # don't exist come back with "missing" set.
+    def iter_imageinfo(self, titles, iiprop="size|user|timestamp", history=False, batch_size=None):
+        params = {
+            "action": "query",
+            "format": "json",
+            "prop": "imageinfo",
+            "iiprop": iiprop,
+            "iilimit": "max" if history else 1,
+        }
+        return self._iter_batches(params, 'titles', titles, batch_size)
+
     def backlinks(self, pageid):
+        return list(self.iter_backlinks(pageid))
+
+    def iter_backlinks(self, pageid, limit=None, cont=None):
+        return Continuation(self, self.backlinks_query(pageid), limit, cont)
+
+    @staticmethod
+    def backlinks_query(pageid):
         params = {
             "action": "query",
             "format": "json",
@@ -364,20 +894,16 @@ class Mwbot():
             "blfilterredir": "nonredirects",
             "blpageid": pageid,
         }
-        res = self.query(params).json()
-        output = res["query"]["backlinks"]
-        while "continue" in res:
-            params["blcontinue"] = res["continue"]["blcontinue"]
-            res = self.query(params).json()
-            pages = res["query"]["backlinks"]
-            output.extend(pages)
+        return Query(params, _list_items("backlinks"), "bllimit", 'backlinks')
 
-            if self.debug:
-                print('backlinks query:', len(output))
+    def links(self, pageids):
+        return list(self.iter_links(pageids))
 
-        return output
+    def iter_links(self, pageids, limit=None, cont=None):
+        return Continuation(self, self.links_query(pageids), limit, cont)
 
-    def links(self, pageids):
+    @staticmethod
+    def links_query(pageids):
         params = {
             "action": "query",
             "format": "json",
@@ -386,22 +912,16 @@ class Mwbot():
             "pageids": pageids,
             "redirects": "true",
         }
-        res = self.query(params).json()
-        output = res["query"]["pages"]
+        return Query(params, _all_pages, "gpllimit", 'links')
 
-        while "continue" in res:
-            params["gplcontinue"] = res["continue"]["gplcontinue"]
-            res = self.query(params).json()
-            pages = res["query"]["pages"]
-            new_output = list(pages.values())
-            output.extend(new_output)
-
-            if self.debug:
-                print('links query:', len(output))
+    def thanks(self):
+        return list(self.iter_thanks())
 
-        return output
+    def iter_thanks(self, limit=None, cont=None):
+        return Continuation(self, self.thanks_query(), limit, cont)
 
-    def thanks(self):
+    @staticmethod
+    def thanks_query():
         params = {
             "action": "query",
             "format": "json",
@@ -409,20 +929,26 @@ class Mwbot():
             "letype": "thanks",
             "lelimit": "max",
         }
-        res = self.query(params).json()
-        output = res["query"]["logevents"]
-
-        while "continue" in res:
-            params["lecontinue"] = res["continue"]["lecontinue"]
-            res = self.query(params).json()
-            pages = res["query"]["logevents"]
-            new_output = list(pages.values())
-            output.extend(new_output)
+        return Query(params, _list_items("logevents"), "lelimit", 'thanks')
 
-            if self.debug:
-                print('thanks query:', len(output))
+    # Changes from `start` onwards (oldest first), or newest first from now with direction='older'
+    def iter_recentchanges(self, start=None, direction='newer', rctype='edit|new|log', limit=None, cont=None):
+        return Continuation(self, self.recentchanges_query(start, direction, rctype), limit, cont)
 
-        return output
+    @staticmethod
+    def recentchanges_query(start=None, direction='newer', rctype='edit|new|log'):
+        params = {
+            "action": "query",
+            "format": "json",
+            "list": "recentchanges",
+            "rcdir": direction,
+            "rcprop": "title|ids|timestamp|loginfo",
+            "rctype": rctype,
+            "rclimit": "max",
+        }
+        if start:
+            params["rcstart"] = start
+        return Query(params, _list_items("recentchanges"), "rclimit", 'recentchanges')
 
     # https://oldschool.runescape.wiki/api.php?action=query&list=logevents&titles=Talk:Cormorant
     def logevents_by_title(self, title):
@@ -432,4 +958,26 @@ class Mwbot():
             "list": "logevents",
             "letitle": title,
         }
-        return self.query(params).json()
+        return self.query_json(params)
+
+
+# Logs into the wiki with the bot account for the scripts in this repo, reading the user agent from bot/agent.txt and
+# the credentials from bot/creds.file; exits with an error if either file is missing
+def login_bot(workers=1, rate=None, maxlag=None, cache=None):
+    # load user agent from file
+    try:
+        with open(".\\bot\\agent.txt", 'r') as uafile:
+            agent = uafile.read().strip(" \r\n")
+    except FileNotFoundError:
+        # if no user agent available, exit with an error
+        print('User agent file not found')
+        sys.exit(1)
+
+    # Log into bot using credentials for wiki bot account
+    try:
+        return Mwbot(creds_file='.\\bot\\creds.file', workers=workers, rate=rate, maxlag=maxlag, cache=cache,
+                     user_agent=agent)
+    except FileNotFoundError:
+        # if no credentials are found, exit with an error
+        print('File with bot account credentials not found')
+        sys.exit(1)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+import threading
+import time
+from collections import OrderedDict
+
+from bot.metrics import MODULE_PARAMS, request_tag
+
+# Seconds a response stays fresh, by API module (e.g. 'list=logevents') or, failing that, by action. Modules are
+# looked up first, so a request using several takes the shortest TTL among them.
+DEFAULT_TTLS = {
+    'query': 60,
+    'parse': 60,
+    'prop=imageinfo': 300,
+    'list=logevents': 30,
+}
+
+# Actions that only read, and so may be served from the cache
+READ_ACTIONS = ('query', 'parse')
+
+# Parameters naming the pages a request is about
+TITLE_PARAMS = ('titles', 'title', 'letitle', 'page')
+
+# Parameters whose pipe-separated values can be given in any order without changing the result
+UNORDERED_PARAMS = ('titles', 'pageids', 'revids')
+
+# Parameters that don't affect the response
+IGNORED_PARAMS = ('maxlag',)
+
+# Props whose results depend only on the pages they're asked about; the rest (transcludedin, linkshere, redirects,
+# fileusage, categoryinfo, ...) change with edits to other pages
+PAGE_LOCAL_PROPS = ('revisions', 'info', 'imageinfo', 'categories', 'templates')
+
+# Parameters selecting pages by something other than title
+PAGE_PARAMS = ('pageids', 'revids')
+
+
+def normalize_title(title):
+    title = str(title).replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+
+def _value(key, value):
+    if isinstance(value, (list, tuple)):
+        value = '|'.join(str(v) for v in value)
+    value = str(value)
+    if key in TITLE_PARAMS:
+        value = '|'.join(normalize_title(t) for t in value.split('|'))
+    if key in UNORDERED_PARAMS:
+        value = '|'.join(sorted(value.split('|')))
+    return value
+
+
+# Cache key of a request: its parameters as strings, in a fixed order
+def cache_key(params):
+    return tuple(sorted((key, _value(key, value)) for key, value in params.items() if key not in IGNORED_PARAMS))
+
+
+# Titles a request names, or None when it selects pages some other way (by pageid, generator or list) or asks for
+# props that depend on other pages, and so may involve any page
+def request_titles(params):
+    titles = set()
+    for key in TITLE_PARAMS:
+        if key in params:
+            titles.update(_value(key, params[key]).split('|'))
+    if not titles or any(key in params for key in ('pageids', 'revids', 'generator')):
+        return None
+    # lists other than a title's log entries aren't about the titles given
+    if params.get('list', 'logevents') != 'logevents':
+        return None
+    if any(prop not in PAGE_LOCAL_PROPS for prop in _value('prop', params.get('prop', '')).split('|') if prop):
+        return None
+    return titles
+
+
+# Whether params fetch content in bulk: a generator, or page contents for more than one page. Such responses are big
+# and read once by a crawl, so caching them would only push out the small lookups that do get repeated.
+def is_bulk(params):
+    if params.get('generator'):
+        return True
+    if 'content' not in _value('rvprop', params.get('rvprop', '')).split('|'):
+        return False
+    pages = [_value(key, params[key]).split('|') for key in TITLE_PARAMS + PAGE_PARAMS if key in params]
+    return sum(len(values) for values in pages) > 1
+
+
+# In-memory LRU cache of responses to read-only requests, each kept for its action's TTL. Writes made through the bot
+# invalidate the entries for the pages they touch; entries for requests that aren't tied to named titles are dropped
+# on every write, so a cached read never predates one of the bot's own writes. Bulk content requests (see is_bulk)
+# aren't cached. Thread-safe.
+class ResponseCache():
+
+    # maxsize bounds the number of responses kept and maxbytes their total body size; ttls overrides or extends
+    # DEFAULT_TTLS
+    def __init__(self, maxsize=1024, maxbytes=32 * 1024 * 1024, ttls=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+
+    # Seconds a response to params stays fresh, or None if it isn't cacheable
+    def ttl(self, params):
+        action, _ = request_tag(params)
+        if action not in READ_ACTIONS:
+            return None
+        ttls = [self.ttls[f'{key}={params[key]}'] for key in MODULE_PARAMS
+                if f'{key}={params.get(key)}' in self.ttls]
+        if ttls:
+            return min(ttls)
+        return self.ttls.get(action)
+
+    def cacheable(self, params):
+        return bool(self.ttl(params)) and not is_bulk(params)
+
+    # The cached response to params, or None on a miss
+    def get(self, params):
+        key = cache_key(params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._drop(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, params, res):
+        size = len(res.content)
+        if not self.cacheable(params) or size > self.maxbytes:
+            return
+        ttl = self.ttl(params)
+        key = cache_key(params)
+        module = request_tag(params)[1]
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (time.monotonic() + ttl, res, request_titles(params), module, size)
+            self.nbytes += size
+            while len(self.entries) > self.maxsize or self.nbytes > self.maxbytes:
+                self._drop(next(iter(self.entries)))
+                self.evicted += 1
+
+    # Removes an entry; the lock must be held
+    def _drop(self, key):
+        self.nbytes -= self.entries.pop(key)[4]
+
+    # Drops the entries that may involve any of titles, plus those for requests using any of modules
+    # (e.g. 'list=logevents')
+    def invalidate(self, titles=(), modules=()):
+        titles = {normalize_title(t) for t in titles}
+        with self.lock:
+            stale = [key for key, (_, _, entry_titles, module, _) in self.entries.items()
+                     if entry_titles is None or entry_titles & titles or any(m in module for m in modules)]
+            for key in stale:
+                self._drop(key)
+            self.invalidated += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.nbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'invalidated': self.invalidated,
+            }
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+import sqlite3
+
+
+# On-disk SQLite store of page wikitext, keyed by pageid and the revid the text belongs to. Lets repeat runs
+# download content only for pages edited since the text was stored.
+class RevisionCache():
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS revisions ('
+            'pageid INTEGER PRIMARY KEY, revid INTEGER NOT NULL, title TEXT NOT NULL, content TEXT NOT NULL)'
+        )
+
+    # Maps each of pageids that has a stored revision to that revision's revid
+    def revids(self, pageids):
+        pageids = list(pageids)
+        output = {}
+        # stay under SQLite's bound parameter limit
+        for i in range(0, len(pageids), 500):
+            chunk = pageids[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            rows = self.conn.execute(f'SELECT pageid, revid FROM revisions WHERE pageid IN ({marks})', chunk)
+            output.update(rows)
+        return output
+
+    # Returns (revid, title, content) for a page, or None if it isn't stored
+    def get(self, pageid):
+        return self.conn.execute('SELECT revid, title, content FROM revisions WHERE pageid = ?', (pageid,)).fetchone()
+
+    def put(self, pageid, revid, title, content):
+        self.conn.execute('INSERT OR REPLACE INTO revisions VALUES (?, ?, ?, ?)', (pageid, revid, title, content))
+
+    def remove(self, pageid):
+        self.conn.execute('DELETE FROM revisions WHERE pageid = ?', (pageid,))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
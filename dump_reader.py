@@ -0,0 +1,124 @@
+# MIT License
+#
+# Copyright (c) 2024 Chris Fisher ("cdfisher")
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""dump_reader.py - (c) 2024 Chris Fisher ("cdfisher")
+Streaming reader for MediaWiki XML exports (Special:Export or database dumps), optionally bz2 or gzip compressed,
+yielding the same (pageid, title, wikitext) records as the API fetch path without holding more than one page in memory.
+"""
+
+import bz2
+import gzip
+import re
+from xml.etree.ElementTree import iterparse
+
+
+def open_dump(path: str):
+    """Opens a dump file for reading as bytes, decompressing it on the fly if it ends in `.bz2` or `.gz`.
+
+    :param path: Path to the dump file.
+    :type path: str
+
+    :return: A binary file object.
+    """
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def transclusion_pattern(template: str) -> re.Pattern:
+    """Builds a pattern matching direct transclusions of a template, allowing for the case-insensitive first letter,
+    spaces or underscores between words, and an optional `Template:` prefix.
+
+    :param template: Name of the template, e.g. `Infobox Item`.
+    :type template: str
+
+    :return: Compiled pattern to search wikitext with.
+    :rtype: re.Pattern
+    """
+    words = template.strip().split()
+    first = words[0]
+    words[0] = f'[{re.escape(first[0].upper())}{re.escape(first[0].lower())}]{re.escape(first[1:])}'
+    name = '[ _]+'.join(words[:1] + [re.escape(w) for w in words[1:]])
+    return re.compile(r'\{\{\s*(?:[Tt]emplate\s*:\s*)?' + name + r'\s*(?:\||\}\}|<!--)')
+
+
+def iter_dump(path: str, namespaces=(0,), transcludes=None, revids=False):
+    """Streams pages from a MediaWiki XML export.
+
+    Only the last revision of each page is used, so full-history dumps give the current text. Each page's elements are
+    discarded as soon as it has been read, so memory use stays flat however large the dump is.
+
+    :param path: Path to the dump file, which may be bz2 or gzip compressed.
+    :type path: str
+
+    :param namespaces: Namespace numbers of pages to yield, or None for all namespaces, defaults to mainspace only.
+    :type namespaces: tuple
+
+    :param transcludes: If given, only pages that directly transclude the template with this name are yielded. Pages
+    that only use it through another template aren't detected.
+    :type transcludes: str
+
+    :param revids: Whether to add the ID of the revision the text belongs to to each tuple, defaults to False.
+    :type revids: bool
+
+    :return: Generator of (pageid, title, wikitext) tuples, or (pageid, title, wikitext, revid) with `revids`.
+    """
+    pattern = transclusion_pattern(transcludes) if transcludes else None
+
+    with open_dump(path) as f:
+        root = None
+        for event, elem in iterparse(f, events=('start', 'end')):
+            # tags are namespaced by export schema version, e.g. {http://www.mediawiki.org/xml/export-0.11/}page
+            tag = elem.tag.rpartition('}')[2]
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if tag != 'page':
+                continue
+
+            ns = title = pageid = text = revid = None
+            for child in elem:
+                child_tag = child.tag.rpartition('}')[2]
+                if child_tag == 'ns':
+                    ns = int(child.text)
+                elif child_tag == 'title':
+                    title = child.text
+                elif child_tag == 'id':
+                    pageid = int(child.text)
+                elif child_tag == 'revision':
+                    for rev_child in child:
+                        rev_tag = rev_child.tag.rpartition('}')[2]
+                        if rev_tag == 'text':
+                            text = rev_child.text or ''
+                        elif rev_tag == 'id':
+                            revid = int(rev_child.text)
+            # finished with this page; drop it (and its reference from the root) to keep memory bounded
+            root.clear()
+
+            if namespaces is not None and ns not in namespaces:
+                continue
+            if text is None or (pattern is not None and pattern.search(text) is None):
+                continue
+            yield (pageid, title, text, revid) if revids else (pageid, title, text)
@@ -20,18 +20,22 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-class GalleryListEntry:
-    def __init__(self, page_name, header, release):
-        self.page_name = page_name
-        self.header = header
-        self.release = release
+import csv
+import io
+from collections import namedtuple
+
+
+# One row of the gallery list. Immutable and without a per-instance __dict__, so large result sets stay compact;
+# str() gives the entry as a properly quoted CSV row.
+class GalleryListEntry(namedtuple('GalleryListEntry', ['page_name', 'header', 'release'])):
+    __slots__ = ()
 
     def __str__(self):
-        if ',' in self.page_name:
-            self.page_name = f'"{self.page_name}"'
-        if ',' in self.header:
-            self.header = f'"{self.header}"'
-        if ',' in self.release:
-            self.release = f'"{self.release}"'
+        row = io.StringIO()
+        csv.writer(row, lineterminator='').writerow(self)
+        return row.getvalue()
+
 
-        return f'{self.page_name},{self.header},{self.release},'
+# One file shown in a page's historical gallery, with the details of its current upload. The upload fields are empty
+# for files that don't exist.
+GalleryImage = namedtuple('GalleryImage', ['page_name', 'file', 'timestamp', 'user', 'size', 'width', 'height'])
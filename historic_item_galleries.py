@@ -20,168 +20,473 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import argparse
+import json
+import os
 import re
-import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import bot.mwbot as mw
-import requests
 import mwparserfromhell
 
-from gallery_entry import GalleryListEntry
-
-API_URL = 'https://oldschool.runescape.wiki/api.php'
-
-# load user agent from file
-try:
-    with open(".\\bot\\agent.txt", 'r') as uafile:
-        agent = uafile.read().strip(" \r\n")
-except FileNotFoundError:
-    # if no user agent available, exit with an error
-    print('User agent file not found')
-    sys.exit(1)
-
-# Log into bot using credentials for wiki bot account
-try:
-    bot = mw.Mwbot(creds_file='.\\bot\\creds.file')
-except FileNotFoundError:
-    # if no credentials are found, exit with an error
-    print('File with bot account credentials not found')
-    sys.exit(1)
-
-bot.login()
-
-# get set of page IDs for pages using {{Infobox Item}}
-members = bot.transcludedin('Template: Infobox Item')
-
-id_set = set()
-for _ in members:
-    for k in _.keys():
-        id_set.add(_[k])
-
-
-# Fetch page contents and name fron the page ID
-def parse(page_id: int):
-    params = {
-        "action": "query",
-        "prop": "revisions",
-        "rvprop": "content",
-        "rvslots": "main",
-        "rvlimit": 1,
-        "pageids": page_id,
-        "format": "json",
-        "formatversion": "2",
-    }
-    headers = {"User-Agent": agent}
-    req = requests.get(API_URL, headers=headers, params=params)
-    try:
-        res = req.json()
-        pagename = res["query"]["pages"][0]["title"]
-        revision = res["query"]["pages"][0]["revisions"][0]
-        text = revision["slots"]["main"]["content"]
-        return mwparserfromhell.parse(text), pagename
-    except requests.exceptions.JSONDecodeError:
-        print(f'JSONDecodeError for ID {page_id}, \n{req}')
-    except KeyboardInterrupt:
-        raise KeyboardInterrupt
-    except:
-        print(f'Exception from ID {page_id}\n')
-
-
-# Check if page has a "Gallery (Historical)" section
-def has_gallery(page):
-    headings = page.filter_headings(recursive=True)
-    for h in headings:
-        # matching on "historic" instead of "gallery" because there are some non-historical galleries on
-        # pages, which isn't what we're after here
-        if re.search(r"historic", str(h.title), re.IGNORECASE) is not None:
-            print(h.title)
-            return True, str(h.title)
-    return False, ""
-
-
-entries = []
-
-i = 0
-n_ids = len(id_set)
-for _ in id_set:
-    i += 1
-
-    print(f'Checking page {i} of {n_ids}) {_}')
+from gallery_entry import GalleryImage, GalleryListEntry
+from parser_utils import COMMENT_RE, get_gallery_files
+from dump_reader import iter_dump
+from output_sinks import open_sink, read_records
+from profiler import Profiler, phase
+from rule_scan import HISTORIC_GALLERIES, match_page
+from template_index import TemplateIndex
+
+# Pre-filter patterns: a page can only produce entries if some line starts a heading containing "historic" and a
+# 2000-2007 year appears somewhere in it. Both are necessary conditions of check_page, so skipping pages that fail
+# them never changes the output.
+HISTORIC_HEADING_RE = re.compile(r"^[ \t]*=[^\n]*historic", re.IGNORECASE | re.MULTILINE)
+EARLY_YEAR_RE = re.compile(r"200[0-7]")
+
+# Pages added to a --build-index index between commits
+INDEX_COMMIT_EVERY = 500
+
+
+# Cheap check on raw wikitext for whether a page could have entries, to avoid building parse trees for most pages
+def is_candidate(text):
+    if HISTORIC_HEADING_RE.search(text) is None:
+        return False
+    if EARLY_YEAR_RE.search(text) is not None:
+        return True
+    # release values are matched with comments stripped, which can join up a year split by a comment
+    return '<!--' in text and EARLY_YEAR_RE.search(COMMENT_RE.sub("", text)) is not None
+
+
+# Get gallery list entries for a page's pre-2007 Infobox Item versions that have a historical gallery
+def check_page(name, mwtext, profiler=None):
+    # the default "release" param and each version's "releaseN" are checked for a 2000-2007 date; we want prior to
+    # 10 August 2007 but this is a good rough approach for now
+    found = []
+    with phase(profiler, 'templates'):
+        for _, (page_name, head, val) in match_page([HISTORIC_GALLERIES], name, mwtext, profiler):
+            print(head)
+            found.append(GalleryListEntry(page_name, head, val))
+    return found
+
+
+# Yields (pageid, title, wikitext) for every mainspace page using {{Infobox Item}}, leaving out any with IDs in skip.
+# The server filters on namespace, so the text of pages outside of mainspace is never downloaded.
+# With revids=True each tuple also carries the revid of the text, e.g. for the template index.
+def infobox_pages(bot, skip=(), revids=False):
+    if bot.workers > 1 or bot.cache is not None or skip:
+        # list the page IDs first (cheap), then fetch contents as batches of IDs, concurrently and/or
+        # skipping pages whose cached revision is still current. Resuming from a checkpoint goes this way too, so
+        # pages already checked are dropped before their contents are downloaded rather than after.
+        ids = [p['pageid'] for p in bot.iter_transcludedin('Template: Infobox Item', namespace='0')
+               if p['pageid'] not in skip]
+        yield from bot.page_texts(ids, parse=False, revids=revids)
+    else:
+        # stream pages along with their contents, checking each batch as it arrives
+        for page in bot.transcludedin_pages('Template: Infobox Item', namespace=0):
+            if page['pageid'] not in skip:
+                revision = page['revisions'][0]
+                record = page['pageid'], page['title'], revision['*']
+                yield record + (revision['revid'],) if revids else record
+
+
+# Yields (pageid, entries) for each raw (pageid, title, wikitext) page, skipping those is_candidate rules out if
+# prefilter is set. Pages are expected to be from mainspace only, as every page source here lists them.
+# If given a TemplateIndex, every page checked is also added to it, with its revid if pages are given as
+# (pageid, title, wikitext, revid), and committed every INDEX_COMMIT_EVERY pages so an interrupted scan keeps them.
+# If given a Profiler, time spent on each phase and page is recorded in it.
+# If given a dict as files, the historical gallery files of each page with entries are added to it by title, taken
+# from the parse tree already built for the page (see gallery_images).
+def scan(pages, index=None, prefilter=False, profiler=None, files=None):
+    i = skipped = 0
+    for page_id, name, text, *revid in pages:
+        i += 1
+
+        print(f'Checking page {i}) {page_id}')
+
+        start = time.perf_counter()
+        if prefilter:
+            with phase(profiler, 'prefilter'):
+                candidate = is_candidate(text)
+            if not candidate:
+                skipped += 1
+                yield page_id, []
+                continue
+
+        print(f'Page: {name}')
+
+        with phase(profiler, 'parse'):
+            mwtext = mwparserfromhell.parse(text)
+        if index is not None:
+            with phase(profiler, 'index'):
+                index.add_page(page_id, name, mwtext, revid[0] if revid else None)
+                if i % INDEX_COMMIT_EVERY == 0:
+                    index.commit()
+        entries = check_page(name, mwtext, profiler)
+        if files is not None and entries:
+            with phase(profiler, 'images'):
+                files[name] = get_gallery_files(mwtext, 'historic')
+        if profiler is not None:
+            profiler.page(page_id, name, len(text), time.perf_counter() - start)
+        yield page_id, entries
+
+    if prefilter:
+        print(f'Pre-filter: {skipped} of {i} pages skipped without parsing')
+
+
+# Worker for scan_parallel: parses and checks a chunk of (pageid, title, wikitext) pages in a child process,
+# sending back only the (small) entries found rather than any parse trees, as (pageid, title, entries, files) with
+# files being the historical gallery files of pages with entries if galleries is set, or None
+def check_chunk(chunk, galleries=False):
+    results = []
+    for page_id, name, text in chunk:
+        mwtext = mwparserfromhell.parse(text)
+        entries = check_page(name, mwtext)
+        files = get_gallery_files(mwtext, 'historic') if galleries and entries else None
+        results.append((page_id, name, entries, files))
+    return results
+
+
+# Like scan, but parsing and checking is spread over a pool of processes in chunks of chunksize pages. Pages stream
+# through: only a couple of chunks per process are held at once. files is filled in as by scan.
+def scan_parallel(pages, processes, prefilter=False, chunksize=50, files=None):
+    def collect(results):
+        for page_id, name, entries, page_files in results:
+            if page_files is not None:
+                files[name] = page_files
+            yield page_id, entries
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = deque()
+        chunk = []
+        i = 0
+        for page_id, name, text in pages:
+            i += 1
+            print(f'Checking page {i}) {page_id}')
+            if prefilter and not is_candidate(text):
+                yield page_id, []
+                continue
+
+            chunk.append((page_id, name, text))
+            if len(chunk) == chunksize:
+                pending.append(pool.submit(check_chunk, chunk, files is not None))
+                chunk = []
+            if len(pending) >= 2 * processes:
+                yield from collect(pending.popleft().result())
+
+        if chunk:
+            pending.append(pool.submit(check_chunk, chunk, files is not None))
+        while pending:
+            yield from collect(pending.popleft().result())
+
+
+# Scans raw (pageid, title, wikitext) pages as set up by the command line options
+def scan_pages(pages, args, index=None, profiler=None, files=None):
+    if args.processes > 1:
+        return scan_parallel(pages, args.processes, args.prefilter, files=files)
+    if profiler is not None:
+        # time spent waiting on the page source: listing, requests and JSON decoding, or reading a dump
+        pages = profiler.timed(pages, 'fetch')
+    return scan(pages, index, args.prefilter, profiler, files)
+
+
+# Flattens scan results into the entries found
+def found(results):
+    for page_id, entries in results:
+        yield from entries
+
+
+# Append-only journal of the pages a scan has processed and the entries found on them, synced to disk every
+# `every` pages, so that an interrupted scan can resume from its last checkpoint rather than from the start
+class Checkpoint:
+
+    def __init__(self, path, every=100):
+        self.path = path
+        self.every = every
+        self.done = set()
+        self.entries = []
+        line = ''
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a line cut short by the interruption; that page just gets checked again
+                        continue
+                    self.done.add(record['pageid'])
+                    self.entries.extend(GalleryListEntry(*e) for e in record['entries'])
+        self.file = open(path, 'a')
+        # start on a fresh line if the last one was cut short
+        if line and not line.endswith('\n'):
+            self.file.write('\n')
+        self.unsynced = 0
+
+    def record(self, page_id, entries):
+        self.file.write(json.dumps({'pageid': page_id, 'entries': entries}) + '\n')
+        self.unsynced += 1
+        if self.unsynced >= self.every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+    # Entries from the journal followed by those found in results, recording each page as it goes by
+    def entries_from(self, results):
+        yield from self.entries
+        for page_id, entries in results:
+            self.record(page_id, entries)
+            yield from entries
+
+
+# Opens the checkpoint journal at path, if any, returning it along with the IDs of the pages it has as checked
+def open_checkpoint(path):
+    if path is None:
+        return None, set()
+    checkpoint = Checkpoint(path)
+    if checkpoint.done:
+        print(f'Resuming from checkpoint: {len(checkpoint.done)} pages already checked')
+    return checkpoint, checkpoint.done
+
+
+# Gallery list entries answered by lookups in a TemplateIndex, without fetching or parsing any pages
+def entries_from_index(index):
+    entries = []
+    for page_id, name, version, val in index.matching_params('Infobox Item', 'release', r"200[0-7]"):
+        head = index.first_heading(page_id, r"historic")
+        if head is not None:
+            entries.append(GalleryListEntry(name, head, val))
+    return entries
+
+
+# Writes each entry as it's produced, so results found so far are on disk even if the run is cut short. The format
+# follows the file extension: CSV by default, .jsonl for JSON lines or .parquet for Parquet (needs pyarrow).
+def write_entries(path, entries, profiler=None):
+    with open_sink(path, GalleryListEntry._fields) as sink:
+        for e in entries:
+            with phase(profiler, 'output'):
+                sink.write(e)
+
+
+# Streams scan results to the output file, through the checkpoint journal if there is one. The journal is removed
+# once the whole scan has been written, so the next run starts afresh.
+def write_results(path, results, checkpoint=None, profiler=None):
+    if checkpoint is None:
+        write_entries(path, found(results), profiler)
+        return
 
     try:
-        mwtext, name = parse(_)
-        # Ignore the two common cases one might expect to see outside of mainspace
-        if name.startswith('User:') or name.startswith('Template:'):
-            print(f'Skipping page: {name}')
-            continue
-    except requests.exceptions.JSONDecodeError as e:
-        print(f'JSONDecodeError for ID {_}')
-        continue
-    except TypeError:
-        print(f'Exception for ID {_}')
-        continue
-
-    print(f'Page: {name}')
-
-    templates = mwtext.filter_templates(recursive=True)
-
-    for t in templates:
-        if t.name.matches('Infobox Item'):
-            # check if there's a "release param" that contains "2007"
-            # we want prior to 10 August 2007 but this is a good rough approach for now
-            if t.has('release'):
-                val = t.get('release').value.strip(' \n')
-                val = re.sub("(<!--.*?-->)", "", val, flags=re.DOTALL)
-                if re.search(r"200[0-7]", val) is not None:
-                    gal, head = has_gallery(mwtext)
-                    if gal:
-                        entries.append(GalleryListEntry(name, head, val))
-
-
-                # check for multiple versions
-                n = 0
-                while True:
-                    n += 1
-                    if t.has(f'version{n}'):
-                        if t.has(f'release{n}'):
-                            val = t.get(f'release{n}').value.strip(' \n')
-                            val = re.sub("(<!--.*?-->)", "", val, flags=re.DOTALL)
-                            if re.search(r"200[0-7]", val) is not None:
-                                # call the check for gallery func
-                                gal, head = has_gallery(mwtext)
-                                if gal:
-                                    entries.append(GalleryListEntry(name, head, val))
-
-                        else:
-                            continue
-                    else:
-                        break
-
-            else:
-                # check for multiple versions
-                n = 0
-                while True:
-                    n += 1
-                    if t.has(f'version{n}'):
-                        if t.has(f'release{n}'):
-                            val = t.get(f'release{n}').value.strip(' \n')
-                            val = re.sub("(<!--.*?-->)", "", val, flags=re.DOTALL)
-                            if re.search(r"200[0-7]", val) is not None:
-                                # call the check for gallery func
-                                gal, head = has_gallery(mwtext)
-                                if gal:
-                                    entries.append(GalleryListEntry(name, head, val))
-
-                        else:
-                            continue
-                    else:
-                        break
-
-        else:
+        write_entries(path, checkpoint.entries_from(results), profiler)
+    finally:
+        checkpoint.close()
+    os.remove(checkpoint.path)
+
+
+# Yields a GalleryImage for each file in the historical galleries of the pages titled, with its current upload.
+# files maps titles to their gallery files as collected by scan; only pages missing from it (e.g. checked before a
+# checkpoint or unchanged since the last incremental run) have their texts fetched, a batch of titles at a time. The
+# files' details are then fetched a batch of files at a time.
+def gallery_images(bot, titles, files=None):
+    files = dict(files or {})
+    for page in bot.iter_title_revisions([title for title in titles if title not in files]):
+        if 'revisions' in page:
+            files[page['title']] = get_gallery_files(mwparserfromhell.parse(page['revisions'][0]['*']), 'historic')
+
+    pages = {}
+    for title in titles:
+        for name in files.get(title, []):
+            pages.setdefault(name, []).append(title)
+
+    for info in bot.iter_imageinfo(list(pages)):
+        upload = info.get('imageinfo', [{}])[0]
+        fields = [str(upload.get(key, '')) for key in GalleryImage._fields[2:]]
+        for page_name in pages.get(info['title'], []):
+            yield GalleryImage(page_name, info['title'], *fields)
+
+
+def write_images(path, images, profiler=None):
+    with open_sink(path, GalleryImage._fields) as sink:
+        for image in images:
+            with phase(profiler, 'images'):
+                sink.write(image)
+
+
+# High-water mark of the most recent change already reflected in the output, or None on the first run
+def load_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_state(path, change):
+    with open(path, 'w') as f:
+        json.dump({'timestamp': change['timestamp'], 'rcid': change['rcid']}, f)
+
+
+# Whether every change since the state's high-water mark is still in recentchanges. Changes older than the wiki's
+# $wgRCMaxAge are purged, so if the oldest change still listed is newer than the mark, some changes in between may be
+# gone and only a full scan gives correct output.
+def changes_retained(bot, state):
+    oldest = next(iter(bot.iter_recentchanges(limit=1)), None)
+    return oldest is not None and oldest['timestamp'] <= state['timestamp']
+
+
+# Titles touched by edits, creations, moves and deletions since the state's high-water mark, and the IDs of those
+# pages that are now in mainspace (so pages elsewhere are never downloaded)
+def changes_since(bot, state):
+    titles = set()
+    namespaces = {}
+    for change in bot.iter_recentchanges(start=state['timestamp']):
+        # rcstart is inclusive, so skip changes at the boundary that were already seen
+        if change['rcid'] <= state['rcid']:
             continue
+        titles.add(change['title'])
+        ns = change.get('ns')
+        # a move also affects the page under its new title, which may be in another namespace
+        if change.get('logtype') == 'move' and 'target_title' in change.get('logparams', {}):
+            titles.add(change['logparams']['target_title'])
+            ns = change['logparams'].get('target_ns', ns)
+        if change.get('pageid'):
+            # changes come oldest first, so this ends up as the namespace the page is in now
+            namespaces[change['pageid']] = ns
+    return titles, {pageid for pageid, ns in namespaces.items() if ns == 0}
+
+
+# Replaces rows for `titles` in an existing output file with `entries`, leaving all other rows untouched
+def patch_output(path, titles, entries):
+    kept = [GalleryListEntry(*row) for row in read_records(path, GalleryListEntry._fields) if row[0] not in titles]
+    write_entries(path, kept + entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List pre-August 2007 items with a historical gallery section.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of requests to keep in flight at once (default: 1)')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='maximum requests per second across all workers (default: unlimited)')
+    parser.add_argument('--maxlag', type=int, default=5,
+                        help='maxlag value sent with each request, in seconds (default: 5)')
+    parser.add_argument('--cache', default=None,
+                        help='SQLite revision cache; only pages edited since the last run are downloaded')
+    parser.add_argument('--incremental', default=None, metavar='STATE',
+                        help='JSON file holding the last change seen; when it and the output exist, only pages '
+                             'changed since are re-checked and the output is patched')
+    parser.add_argument('--output', default='galleries.csv',
+                        help='output file: CSV, or JSON lines/Parquet if it ends in .jsonl/.parquet '
+                             '(default: galleries.csv)')
+    parser.add_argument('--build-index', default=None, metavar='INDEX',
+                        help='also record every scanned page\'s template parameters and headings in this SQLite index')
+    parser.add_argument('--from-index', default=None, metavar='INDEX',
+                        help='answer from an index made with --build-index instead of scanning the wiki')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of processes to parse and check pages with (default: 1)')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='skip parsing pages whose raw text can\'t match (no "historic" heading or 2000-2007 '
+                             'year); output is unchanged')
+    parser.add_argument('--dump', default=None,
+                        help='scan the mainspace pages of a local XML export (optionally .bz2/.gz) instead of the wiki')
+    parser.add_argument('--metrics', default=None,
+                        help='write request metrics here at the end of the run; Prometheus text if the name ends '
+                             'in .prom, JSON otherwise')
+    parser.add_argument('--profile', action='store_true',
+                        help='report the time spent on each phase of the scan, and the slowest and largest pages')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='like --profile, also tracing the peak memory of each phase (slows parsing down)')
+    parser.add_argument('--checkpoint', default=None,
+                        help='journal of checked pages, synced every 100 pages; an interrupted scan given the same '
+                             'journal resumes where it stopped (removed once the scan completes)')
+    parser.add_argument('--images', default=None,
+                        help='also list the files in the galleries found, with their current upload, in this file '
+                             '(CSV, or JSON lines/Parquet as for --output)')
+    args = parser.parse_args()
+    if args.processes > 1 and args.build_index:
+        parser.error('--build-index needs pages parsed in this process and can\'t be used with --processes')
+    if args.prefilter and args.build_index:
+        parser.error('--build-index needs every page parsed and can\'t be used with --prefilter')
+    if args.processes > 1 and (args.profile or args.profile_memory):
+        parser.error('profiling times pages parsed in this process and can\'t be used with --processes')
+    if args.images and (args.dump or args.from_index):
+        parser.error('--images looks files up on the wiki and can\'t be used with --dump or --from-index')
+
+    profiler = Profiler(memory=args.profile_memory) if args.profile or args.profile_memory else None
+
+    if args.from_index:
+        index = TemplateIndex(args.from_index)
+        write_entries(args.output, entries_from_index(index), profiler)
+        index.close()
+        if profiler is not None:
+            print(profiler.report())
+        return
+
+    index = TemplateIndex(args.build_index) if args.build_index else None
+
+    if args.dump:
+        checkpoint, done = open_checkpoint(args.checkpoint)
+        pages = (page for page in iter_dump(args.dump, transcludes='Infobox Item', revids=index is not None)
+                 if page[0] not in done)
+        write_results(args.output, scan_pages(pages, args, index, profiler), checkpoint, profiler)
+        if index is not None:
+            index.close()
+        if profiler is not None:
+            print(profiler.report())
+        return
+
+    bot = mw.login_bot(args.workers, args.rate, args.maxlag, args.cache)
+    # historical gallery files of the pages checked, for --images
+    files = {} if args.images else None
+
+    state = None
+    if args.incremental:
+        state = load_state(args.incremental)
+        # taken before scanning so edits made during the run are picked up by the next one
+        latest = next(iter(bot.iter_recentchanges(direction='older', limit=1)), None)
+        if state is not None and not changes_retained(bot, state):
+            print(f'Changes since {state["timestamp"]} are no longer all in recent changes; rescanning everything')
+            state = None
+
+    # a checkpoint journal left behind means the last full scan was cut short, so its output can't be patched
+    interrupted = args.checkpoint is not None and os.path.exists(args.checkpoint)
+    if state is not None and os.path.exists(args.output) and not interrupted:
+        titles, ids = changes_since(bot, state)
+        print(f'{len(titles)} pages changed since {state["timestamp"]}')
+        # only changed pages are re-checked; pages that were moved or deleted just lose their old rows
+        pages = []
+        for page in bot.page_texts(sorted(ids), parse=False, revids=index is not None):
+            titles.add(page[1])
+            pages.append(page)
+        patch_output(args.output, titles, list(found(scan(pages, index, profiler=profiler, files=files))))
+        if index is not None:
+            for page_id in ids.difference(p[0] for p in pages):
+                index.remove_page(page_id)
+    else:
+        # the checkpoint is only opened for a full scan, as patching the output checks too few pages to need one
+        checkpoint, done = open_checkpoint(args.checkpoint)
+        pages = infobox_pages(bot, skip=done, revids=index is not None)
+        write_results(args.output, scan_pages(pages, args, index, profiler, files), checkpoint, profiler)
+
+    if args.images:
+        titles = dict.fromkeys(row[0] for row in read_records(args.output, GalleryListEntry._fields))
+        write_images(args.images, gallery_images(bot, list(titles), files), profiler)
+
+    if index is not None:
+        index.close()
+
+    if args.incremental and latest is not None:
+        save_state(args.incremental, latest)
+
+    if args.metrics:
+        bot.metrics.write(args.metrics)
+    if profiler is not None:
+        print(profiler.report(bot.metrics))
 
 
-with open('galleries.csv', 'w') as outfile:
-    outfile.write("page_name,header,release\n")
-    for e in entries:
-        outfile.write(f"{e}\n")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+# MIT License
+#
+# Copyright (c) 2024 Chris Fisher ("cdfisher")
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""output_sinks.py - (c) 2024 Chris Fisher ("cdfisher")
+Streaming writers for tuple records (e.g. namedtuples such as GalleryListEntry) to CSV, JSON lines or Parquet, chosen
+by file extension, and the matching readers.
+"""
+
+import csv
+import json
+
+# Parquet support is optional
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class CsvSink:
+    """Writes records as rows of a CSV file through the `csv` module, so values containing commas, quotes or newlines
+    are quoted correctly.
+
+    :param path: Path of the file to write.
+    :type path: str
+
+    :param fields: Column names, written as the header row.
+    :type fields: tuple
+
+    :param flush: Whether to flush each row to disk as it's written, so rows found so far survive an interrupted run,
+    defaults to True.
+    :type flush: bool
+    """
+
+    def __init__(self, path: str, fields: tuple, flush: bool = True):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        self.writer.writerow(fields)
+        self.flush = flush
+
+    def write(self, record: tuple):
+        self.writer.writerow(record)
+        if self.flush:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonlSink:
+    """Writes records as JSON objects, one per line.
+
+    :param path: Path of the file to write.
+    :type path: str
+
+    :param fields: Keys to give each record's values.
+    :type fields: tuple
+
+    :param flush: Whether to flush each record to disk as it's written, defaults to True.
+    :type flush: bool
+    """
+
+    def __init__(self, path: str, fields: tuple, flush: bool = True):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.fields = fields
+        self.flush = flush
+
+    def write(self, record: tuple):
+        self.file.write(json.dumps(dict(zip(self.fields, record)), ensure_ascii=False) + '\n')
+        if self.flush:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetSink:
+    """Writes records to a Parquet file of string columns, in row groups of `batch` records. Requires pyarrow.
+
+    Rows are buffered until a row group is full, so with this sink results only reach the disk a batch at a time.
+
+    :param path: Path of the file to write.
+    :type path: str
+
+    :param fields: Column names.
+    :type fields: tuple
+
+    :param batch: Number of records per row group, defaults to 10000.
+    :type batch: int
+    """
+
+    def __init__(self, path: str, fields: tuple, batch: int = 10000):
+        if pyarrow is None:
+            raise ImportError('Writing Parquet files requires pyarrow')
+        self.fields = fields
+        self.schema = pyarrow.schema([(field, pyarrow.string()) for field in fields])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.batch = batch
+        self.rows = []
+
+    def write(self, record: tuple):
+        self.rows.append(record)
+        if len(self.rows) >= self.batch:
+            self._write_rows()
+
+    def _write_rows(self):
+        columns = [list(column) for column in zip(*self.rows)] if self.rows else [[] for _ in self.fields]
+        self.writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        if self.rows:
+            self._write_rows()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sink(path: str, fields: tuple):
+    """Opens a sink for writing records to path, in a format chosen by its extension: `.jsonl` for JSON lines,
+    `.parquet` for Parquet, and CSV for anything else.
+
+    :param path: Path of the file to write.
+    :type path: str
+
+    :param fields: Names of the records' fields.
+    :type fields: tuple
+
+    :return: A CsvSink, JsonlSink or ParquetSink.
+    """
+    if path.endswith('.jsonl'):
+        return JsonlSink(path, fields)
+    if path.endswith('.parquet'):
+        return ParquetSink(path, fields)
+    return CsvSink(path, fields)
+
+
+def read_records(path: str, fields: tuple):
+    """Reads back the records in a file written by one of the sinks, picking the format by extension as open_sink
+    does.
+
+    :param path: Path of the file to read.
+    :type path: str
+
+    :param fields: Names of the records' fields. CSV rows with extra trailing columns have them dropped.
+    :type fields: tuple
+
+    :return: Generator of tuples of field values.
+    """
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            raise ImportError('Reading Parquet files requires pyarrow')
+        table = pyarrow.parquet.read_table(path, columns=list(fields))
+        yield from zip(*(table.column(field).to_pylist() for field in fields))
+        return
+
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield tuple(record.get(field) for field in fields)
+            return
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if row:
+                yield tuple(row[:len(fields)])
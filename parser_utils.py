@@ -26,7 +26,110 @@ of template parameter values.
 """
 
 import re
+from collections import namedtuple
+from functools import lru_cache
+
 from mwparserfromhell.nodes.template import Template
+from mwparserfromhell.wikicode import Wikicode
+
+COMMENT_RE = re.compile("(<!--.*?-->)", flags=re.DOTALL)
+
+# One value of a template parameter: (template_version_name, parameter_version_name, parameter_value)
+ParamVersion = namedtuple('ParamVersion', ['version', 'param', 'value'])
+
+
+@lru_cache(maxsize=512)
+def compile_pattern(pattern: str, flags: int = 0) -> re.Pattern:
+    """Compiles a regular expression, reusing the compiled pattern for repeat calls with the same arguments.
+
+    :param pattern: Regular expression to compile.
+    :type pattern: str
+
+    :param flags: `re` flags to compile with, defaults to 0.
+    :type flags: int
+
+    :return: The compiled pattern.
+    :rtype: re.Pattern
+    """
+    return re.compile(pattern, flags)
+
+
+class TemplateParams:
+    """Index of a template's parameters by name, built in a single pass over `t.params`.
+
+    Looking up a name is then a dict lookup rather than the linear scan `Template.has` and `Template.get` do, so probing
+    every `version{n}` and `{parameter}{n}` of a template is linear rather than quadratic in its parameter count. As with
+    `Template.get`, the last of any repeated parameter wins.
+
+    :param t: template to index
+    :type t: Template
+    """
+    __slots__ = ('params', 'n_versions')
+
+    def __init__(self, t: Template):
+        self.params = {}
+        for p in t.params:
+            self.params[p.name.strip()] = p
+
+        # versions count up from version1 until the first one missing, as the probing loops always have
+        n = 0
+        while f'version{n + 1}' in self.params:
+            n += 1
+        self.n_versions = n
+
+    def has(self, name: str) -> bool:
+        return name in self.params
+
+    def value(self, name: str) -> str:
+        """Returns the value of parameter `name` with surrounding whitespace stripped, or None if it isn't set."""
+        p = self.params.get(name)
+        if p is None:
+            return None
+        return p.value.strip(' \r\n')
+
+    def versions(self, parameter: str) -> list:
+        """Buckets `parameter` by template version.
+
+        :param parameter: The template parameter of interest.
+        :type parameter: str
+
+        :return: List of (template_version_name, parameter_version_name, value) tuples, starting with ("default",
+        `parameter`, value) and followed by one per template version, in order. Value is None where the template doesn't
+        set that parameter.
+        :rtype: list
+        """
+        buckets = [("default", parameter, self.value(parameter))]
+        for n in range(1, self.n_versions + 1):
+            param = f'{parameter}{n}'
+            buckets.append((f'version{n}', param, self.value(param)))
+        return buckets
+
+
+def _params(t) -> TemplateParams:
+    return t if isinstance(t, TemplateParams) else TemplateParams(t)
+
+
+def _split(ver: str, param: str, val: str, split_comma_vals: bool):
+    if split_comma_vals and ',' in val:
+        for v in val.split(','):
+            yield ParamVersion(ver, param, v)
+    else:
+        yield ParamVersion(ver, param, val)
+
+
+def _all_versions(tp: TemplateParams, parameter: str, split_comma_vals: bool):
+    buckets = tp.versions(parameter)
+    default_val = buckets[0][2]
+
+    if default_val is not None:
+        yield from _split("default", parameter, default_val, split_comma_vals)
+
+    for ver, param, val in buckets[1:]:
+        if val is not None:
+            yield from _split(ver, param, val, split_comma_vals)
+        # Case: multiple template versions, has default parameter
+        elif default_val is not None:
+            yield ParamVersion(ver, "default", default_val)
 
 
 # get all version_name, param_name, param_val sets for a template
@@ -34,7 +137,7 @@ def get_all_param_versions(t: Template, parameter: str, split_comma_vals=True) -
     """Gets a list of all values of a given template parameter used in a template along with which version of the
     template is
 
-    :param t: template to parse
+    :param t: template to parse, or a `TemplateParams` already built for it
     :type t: Template
 
     :param parameter: The template parameter of interest.
@@ -48,90 +151,119 @@ def get_all_param_versions(t: Template, parameter: str, split_comma_vals=True) -
     `template`.
     :rtype: list
     """
-    matches = []
+    return [list(match) for match in _all_versions(_params(t), parameter, split_comma_vals)]
 
-    if t.has(parameter):
-        val = t.get(parameter).value.strip(' \r\n')
 
-        if split_comma_vals:
-            if ',' in val:
-                values = val.split(',')
-                for v in values:
-                    matches.append(["default", parameter, v])
+# get version_name, param_name, param_val sets for several params of a template at once
+def get_param_versions_many(t: Template, parameters: list, split_comma_vals=True) -> dict:
+    """Gets all values of several template parameters in one pass over the template, e.g. an Infobox's `release`,
+    `members`, `tradeable` and `image`. Equivalent to calling `get_all_param_versions` for each parameter, without
+    re-walking the template each time.
 
-            else:
-                matches.append(["default", parameter, val])
+    :param t: template to parse, or a `TemplateParams` already built for it
+    :type t: Template
 
-        else:
-            matches.append(["default", parameter, val])
+    :param parameters: The template parameters of interest.
+    :type parameters: list
 
-        default_val = val
+    :param split_comma_vals: Whether to split parameter values that are comma-separated lists into separate entries,
+    defaults to True.
+    :type split_comma_vals: bool
 
-        # Case: multiple template versions, has default parameter
-        n = 0
-        while True:
-            n += 1
-            ver = f'version{n}'
-            param = f'{parameter}{n}'
-            if t.has(ver):
-                if t.has(param):
-                    val = t.get(param).value.strip(' \r\n')
-                    if split_comma_vals:
-                        if ',' in val:
-                            values = val.split(',')
-                            for v in values:
-                                matches.append([ver, param, v])
+    :return: Returns a dict mapping each of `parameters` to a list of `ParamVersion` (template_version_name,
+    parameter_version_name, parameter_value) tuples, in the same order `get_all_param_versions` returns them.
+    :rtype: dict
+    """
+    tp = _params(t)
+    return {parameter: list(_all_versions(tp, parameter, split_comma_vals)) for parameter in parameters}
 
-                        else:
-                            matches.append([ver, param, val])
 
-                    else:
-                        matches.append([ver, param, val])
+# get version_name, param_name, param_val for template where a param value is matched
+def get_matching_param_versions(t: Template, parameter: str, match_value: str, case_sensitive=False,
+                                strip_comments=True) -> list:
+    """
 
-                else:
-                    matches.append(([ver, "default", default_val]))
+    :param t: template to parse, or a `TemplateParams` already built for it
+    :type t: Template
 
-            else:
-                break
+    :param parameter: The template parameter of interest.
+    :type parameter: str
 
-    # Case: multiple template versions, no default parameter
-    else:
-        n = 0
-        while True:
-            n += 1
-            ver = f'version{n}'
-            param = f'{parameter}{n}'
-            if t.has(ver):
-                if t.has(param):
-                    val = t.get(param).value.strip(' \r\n')
-                    if split_comma_vals:
-                        if ',' in val:
-                            values = val.split(',')
-                            for v in values:
-                                matches.append([ver, param, v])
+    :param match_value: Value to match the `parameter` value against. Can be a regular expression or a basic string.
+    :type match_value: str
 
-                        else:
-                            matches.append([ver, param, val])
+    :param case_sensitive: Whether or not matching is case-sensitive, defaults to False.
+    :type case_sensitive: bool
 
-                    else:
-                        matches.append([ver, param, val])
+    :param strip_comments: Whether or not wikicode comments should be stripped from values before matching, defaults to
+    True.
+    :type strip_comments: bool
 
-                else:
-                    continue
+    :return: Returns a list of all [template_version_name, parameter_version_name, parameter_value] list entries in
+    `template` where parameter_value matches `match_value`.
+    :rtype: list
+    """
+    matches = []
+    if case_sensitive:
+        match_value = match_value.lower()
+    pattern = compile_pattern(match_value)
 
-            else:
-                break
+    for ver, param, val in _params(t).versions(parameter):
+        if val is None:
+            continue
+        if strip_comments:
+            val = COMMENT_RE.sub("", val)
+        if pattern.search(val) is not None:
+            matches.append([ver, param, val])
 
     return matches
 
 
-# get version_name, param_name, param_val for template where a param value is matched
-def get_matching_param_versions(t: Template, parameter: str, match_value: str, case_sensitive=False,
-                                strip_comments=True) -> list:
+def _templates(items, template_name):
+    for item in items:
+        if isinstance(item, Wikicode):
+            templates = item.filter_templates(recursive=True)
+        else:
+            templates = [item]
+        for t in templates:
+            if template_name is None or t.name.matches(template_name):
+                yield t
+
+
+def get_all_param_versions_bulk(items: list, parameter: str, split_comma_vals=True, template_name=None) -> list:
+    """Runs `get_all_param_versions` over many templates at once.
+
+    :param items: Templates and/or parsed pages; every template on a page is included.
+    :type items: list
+
+    :param parameter: The template parameter of interest.
+    :type parameter: str
+
+    :param split_comma_vals: Whether to split `parameter` values that are comma-separated lists into separate entries,
+    defaults to True.
+    :type split_comma_vals: bool
+
+    :param template_name: If given, only templates with this name are included.
+    :type template_name: str
+
+    :return: Returns a list of (template, matches) tuples for each template with any matches, where matches is as
+    returned by `get_all_param_versions`.
+    :rtype: list
     """
+    results = []
+    for t in _templates(items, template_name):
+        matches = get_all_param_versions(t, parameter, split_comma_vals)
+        if matches:
+            results.append((t, matches))
+    return results
 
-    :param t: template to parse
-    :type t: Template
+
+def get_matching_param_versions_bulk(items: list, parameter: str, match_value: str, case_sensitive=False,
+                                     strip_comments=True, template_name=None) -> list:
+    """Runs `get_matching_param_versions` over many templates at once.
+
+    :param items: Templates and/or parsed pages; every template on a page is included.
+    :type items: list
 
     :param parameter: The template parameter of interest.
     :type parameter: str
@@ -146,60 +278,73 @@ def get_matching_param_versions(t: Template, parameter: str, match_value: str, c
     True.
     :type strip_comments: bool
 
-    :return: Returns a list of all [template_version_name, parameter_version_name, parameter_value] list entries in
-    `template` where parameter_value matches `match_value`.
+    :param template_name: If given, only templates with this name are included.
+    :type template_name: str
+
+    :return: Returns a list of (template, matches) tuples for each template with any matches, where matches is as
+    returned by `get_matching_param_versions`.
     :rtype: list
     """
-    matches = []
-    if case_sensitive:
-        match_value = match_value.lower()
+    results = []
+    for t in _templates(items, template_name):
+        matches = get_matching_param_versions(t, parameter, match_value, case_sensitive, strip_comments)
+        if matches:
+            results.append((t, matches))
+    return results
 
-    if t.has(parameter):
-        val = t.get(parameter).value.strip(' \r\n')
-        if strip_comments:
-            val = re.sub("(<!--.*?-->)", "", val, flags=re.DOTALL)
-        if re.search(match_value, val) is not None:
-            matches.append(["default", parameter, val])
 
-        # Case: multiple template versions, has default parameter
-        n = 0
-        while True:
-            n += 1
-            ver = f'version{n}'
-            param = f'{parameter}{n}'
-            if t.has(ver):
-                if t.has(param):
-                    val = t.get(param).value.strip(' \r\n')
-                    if strip_comments:
-                        val = re.sub("(<!--.*?-->)", "", val, flags=re.DOTALL)
-                    if re.search(match_value, val) is not None:
-                        matches.append([ver, param, val])
+def first_matching_heading(headings, pattern: str, case_sensitive=False):
+    """Finds the first of a page's headings matching a regular expression.
 
-                else:
-                    continue
+    :param headings: Titles of the page's headings, in page order.
+    :type headings: iterable
 
-            else:
-                break
+    :param pattern: Regular expression to search heading titles for.
+    :type pattern: str
 
-    # Case: multiple template versions, no default parameter
-    else:
-        n = 0
-        while True:
-            n += 1
-            ver = f'version{n}'
-            param = f'{parameter}{n}'
-            if t.has(ver):
-                if t.has(param):
-                    val = t.get(param).value.strip(' \r\n')
-                    if strip_comments:
-                        val = re.sub("(<!--.*?-->)", "", val, flags=re.DOTALL)
-                    if re.search(match_value, val) is not None:
-                        matches.append([ver, param, val])
+    :param case_sensitive: Whether or not matching is case-sensitive, defaults to False.
+    :type case_sensitive: bool
 
-                else:
-                    continue
+    :return: Title of the first matching heading, or None if there is none.
+    :rtype: str
+    """
+    regex = compile_pattern(pattern, 0 if case_sensitive else re.IGNORECASE)
+    for title in headings:
+        if regex.search(title) is not None:
+            return title
+    return None
 
-            else:
-                break
 
-    return matches
+# Namespace prefixes a gallery line's file may be given with; lines without one are files too
+FILE_PREFIX_RE = re.compile(r"^\s*(?:file|image)\s*:", flags=re.IGNORECASE)
+
+
+def get_gallery_files(page: Wikicode, heading: str = None) -> list:
+    """Lists the files shown in a page's <gallery> tags, optionally only those in sections with a matching heading.
+
+    :param page: Parsed page to search.
+    :type page: Wikicode
+
+    :param heading: If given, only galleries in sections (including subsections) whose heading matches this regular
+    expression, case-insensitively, are included.
+    :type heading: str
+
+    :return: Returns a list of file titles in the form "File:Name.png", in page order and without duplicates.
+    :rtype: list
+    """
+    if heading is None:
+        sections = [page]
+    else:
+        sections = page.get_sections(matches=heading, flags=re.IGNORECASE)
+
+    files = {}
+    for section in sections:
+        for tag in section.filter_tags(recursive=True):
+            if str(tag.tag).strip().lower() != 'gallery' or tag.contents is None:
+                continue
+            for line in COMMENT_RE.sub("", str(tag.contents)).splitlines():
+                # each line is "File:Name.png|caption", with the namespace optional
+                name = ' '.join(FILE_PREFIX_RE.sub("", line.split('|', 1)[0]).replace('_', ' ').split())
+                if name:
+                    files[f'File:{name[:1].upper()}{name[1:]}'] = None
+    return list(files)
@@ -0,0 +1,181 @@
+# MIT License
+#
+# Copyright (c) 2024 Chris Fisher ("cdfisher")
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""profiler.py - (c) 2024 Chris Fisher ("cdfisher")
+Phase-level timing and memory profiling for page scans, reporting where wall time goes along with the slowest and
+largest pages seen.
+"""
+
+import heapq
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    """Accumulates wall time, and optionally memory, spent in named phases of a run.
+
+    Phases may be nested; each phase is charged only the time spent in it outside of any phases nested inside it, so
+    the phase totals add up to no more than the wall time of the run.
+
+    :param outliers: Number of slowest and largest pages to keep for the report, defaults to 10.
+    :type outliers: int
+
+    :param memory: Whether to trace allocations with tracemalloc, reporting the peak memory each phase reached above
+    what was in use when it started. Tracing slows Python code down considerably (network waits much less so), so
+    timings from a memory profile overstate the share of parsing and filtering. Defaults to False.
+    :type memory: bool
+    """
+
+    def __init__(self, outliers: int = 10, memory: bool = False):
+        self.outliers = outliers
+        self.memory = memory
+        self.seconds = {}
+        self.calls = {}
+        self.peaks = {}
+        self.slowest = []
+        self.largest = []
+        self.stack = []
+        if memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+
+    def _fold_peak(self):
+        # credit the peak since the last fold to every open phase, then start measuring afresh
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self.stack:
+            frame[3] = max(frame[3], peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Context manager charging the time spent in its body to a phase.
+
+        :param name: Name of the phase, e.g. `parse`.
+        :type name: str
+        """
+        if self.memory:
+            self._fold_peak()
+            current = tracemalloc.get_traced_memory()[0]
+        else:
+            current = 0
+        # [name, start time, time spent in nested phases, peak memory, memory in use at the start]
+        frame = [name, time.perf_counter(), 0.0, current, current]
+        self.stack.append(frame)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - frame[1]
+            if self.memory:
+                self._fold_peak()
+                self.peaks[name] = max(self.peaks.get(name, 0), frame[3] - frame[4])
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1][2] += elapsed
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - frame[2]
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def timed(self, iterable, name: str):
+        """Iterates over an iterable, charging the time taken to produce each item to a phase.
+
+        :param iterable: Items to pass through, typically a lazy page source.
+
+        :param name: Name of the phase, e.g. `fetch`.
+        :type name: str
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def page(self, page_id: int, title: str, size: int, seconds: float):
+        """Records the time taken over one page, keeping the slowest and largest for the report.
+
+        :param page_id: ID of the page.
+        :type page_id: int
+
+        :param title: Title of the page.
+        :type title: str
+
+        :param size: Length of the page's wikitext.
+        :type size: int
+
+        :param seconds: Time spent processing the page.
+        :type seconds: float
+        """
+        for heap, key in ((self.slowest, seconds), (self.largest, size)):
+            record = (key, page_id, title, size, seconds)
+            if len(heap) < self.outliers:
+                heapq.heappush(heap, record)
+            elif record > heap[0]:
+                heapq.heapreplace(heap, record)
+
+    def report(self, metrics=None) -> str:
+        """Builds a plain text report of the phases and outlier pages.
+
+        :param metrics: Request metrics of the bot used for the run (see `bot/metrics.py`), to break the time spent
+        fetching pages down into requests and JSON decoding per API module.
+
+        :return: The report.
+        :rtype: str
+        """
+        wall = time.perf_counter() - self.start
+        lines = [f'Profile: {wall:.2f}s wall time']
+        header = f'  {"phase":<12} {"seconds":>10} {"share":>7} {"calls":>9}'
+        lines.append(header + (f' {"peak MiB":>9}' if self.memory else ''))
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: item[1], reverse=True):
+            line = f'  {name:<12} {seconds:>10.2f} {seconds / wall:>7.1%} {self.calls[name]:>9}'
+            if self.memory:
+                line += f' {self.peaks[name] / 2 ** 20:>9.1f}'
+            lines.append(line)
+        if self.memory:
+            lines.append(f'  peak traced memory: {tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f} MiB')
+
+        if metrics is not None:
+            lines.append('Requests (seconds summed over concurrent workers):')
+            for row in metrics.summary():
+                lines.append(f'  {row["action"]} {row["module"]}: {row["requests"]} requests, '
+                             f'{row["seconds"]:.2f}s waiting, {row["decode_seconds"]:.2f}s decoding JSON, '
+                             f'{row["bytes_received"] / 2 ** 20:.1f} MiB received')
+
+        lines.append('Slowest pages:')
+        for key, page_id, title, size, seconds in sorted(self.slowest, reverse=True):
+            lines.append(f'  {seconds:.3f}s  {size:>9} chars  {page_id} {title}')
+        lines.append('Largest pages:')
+        for key, page_id, title, size, seconds in sorted(self.largest, reverse=True):
+            lines.append(f'  {size:>9} chars  {seconds:.3f}s  {page_id} {title}')
+        return '\n'.join(lines)
+
+
+def phase(profiler, name: str):
+    """Shorthand for `profiler.phase(name)` that does nothing when there's no profiler.
+
+    :param profiler: A Profiler, or None when not profiling.
+
+    :param name: Name of the phase.
+    :type name: str
+    """
+    return nullcontext() if profiler is None else profiler.phase(name)
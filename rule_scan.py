@@ -0,0 +1,256 @@
+# MIT License
+#
+# Copyright (c) 2024 Chris Fisher ("cdfisher")
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""rule_scan.py - (c) 2024 Chris Fisher ("cdfisher")
+Declarative page scans: many (template, parameter predicate, section predicate) rules evaluated together in a single
+crawl, each page being downloaded and parsed once however many rules look at it, with one output file per rule.
+
+The historic item gallery list is the rule `HISTORIC_GALLERIES`; further reports are added as rules in a JSON file,
+e.g.
+
+    [
+        {"name": "historic_items", "template": "Infobox Item", "parameter": "release", "match": "200[0-7]",
+         "heading": "historic", "output": "galleries.csv"},
+        {"name": "f2p_monsters", "template": "Infobox Monster", "parameter": "members", "match": "^No$",
+         "output": "f2p_monsters.jsonl"}
+    ]
+"""
+
+import argparse
+import json
+from collections import namedtuple
+
+import mwparserfromhell
+
+import bot.mwbot as mw
+from dump_reader import iter_dump, transclusion_pattern
+from output_sinks import open_sink
+from parser_utils import TemplateParams, first_matching_heading, get_matching_param_versions
+from profiler import phase
+from template_index import normalize_template_name
+
+# One report: pages with a `template` whose `parameter` (any version of it) matches the regular expression `match`,
+# and, if `heading` is given, a section heading matching that regular expression. Parameter values are matched
+# case-insensitively unless case_sensitive is set; headings are always matched case-insensitively.
+Rule = namedtuple('Rule', ['name', 'template', 'parameter', 'match', 'heading', 'output', 'case_sensitive'],
+                  defaults=(None, None, False))
+
+# The question historic_item_galleries.py answers, as a rule. Headings are matched on "historic" rather than
+# "gallery" because some pages also have non-historical galleries, which aren't what we're after.
+HISTORIC_GALLERIES = Rule('historic_galleries', 'Infobox Item', 'release', r"200[0-7]", 'historic', 'galleries.csv')
+
+
+def load_rules(path: str) -> list:
+    """Reads rules from a JSON file holding a list of objects with the fields of `Rule`.
+
+    :param path: Path of the rules file.
+    :type path: str
+
+    :return: List of rules. Rules without an output get `<name>.csv`.
+    :rtype: list
+    """
+    with open(path, 'r') as f:
+        specs = json.load(f)
+    rules = []
+    for spec in specs:
+        rule = Rule(**spec)
+        if rule.output is None:
+            rule = rule._replace(output=f'{rule.name}.csv')
+        rules.append(rule)
+    if len({rule.name for rule in rules}) != len(rules):
+        raise ValueError('Rule names must be unique')
+    return rules
+
+
+def rule_fields(rule: Rule) -> tuple:
+    """Columns of a rule's output: the page, the matching heading ('' if the rule has no heading predicate) and the
+    matching parameter value, named after the parameter.
+
+    :param rule: The rule.
+    :type rule: Rule
+
+    :return: Field names.
+    :rtype: tuple
+    """
+    return 'page_name', 'header', rule.parameter
+
+
+def match_page(rules: list, name: str, mwtext, profiler=None) -> list:
+    """Evaluates every rule against one parsed page. Templates and headings are pulled out of the parse tree once and
+    shared by all the rules.
+
+    :param rules: Rules to evaluate.
+    :type rules: list
+
+    :param name: Title of the page.
+    :type name: str
+
+    :param mwtext: The page's parsed wikicode.
+    :type mwtext: Wikicode
+
+    :param profiler: If given, time spent searching headings is charged to its `headings` phase.
+    :type profiler: Profiler
+
+    :return: List of (rule index, (page_name, header, value)) for each match, in rule order and then page order.
+    :rtype: list
+    """
+    wanted = {}
+    for i, rule in enumerate(rules):
+        wanted.setdefault(normalize_template_name(rule.template), []).append(i)
+
+    templates = {}
+    for t in mwtext.filter_templates(recursive=True):
+        key = normalize_template_name(t.name.strip_code())
+        if key in wanted:
+            templates.setdefault(key, []).append(TemplateParams(t))
+
+    if not templates:
+        return []
+
+    headings = None
+    found = []
+    for i, rule in enumerate(rules):
+        # get_matching_param_versions' own case_sensitive flag only lowercases the pattern, so the case-insensitivity
+        # goes in the pattern itself
+        match = rule.match if rule.case_sensitive else f'(?i){rule.match}'
+        for tp in templates.get(normalize_template_name(rule.template), []):
+            for ver, param, val in get_matching_param_versions(tp, rule.parameter, match):
+                if rule.heading is None:
+                    found.append((i, (name, '', val)))
+                    continue
+                with phase(profiler, 'headings'):
+                    if headings is None:
+                        headings = [str(h.title) for h in mwtext.filter_headings(recursive=True)]
+                    head = first_matching_heading(headings, rule.heading)
+                if head is not None:
+                    found.append((i, (name, head, val)))
+    return found
+
+
+def scan_rules(pages, rules: list):
+    """Parses each page once and evaluates all the rules on it.
+
+    :param pages: (pageid, title, wikitext) tuples to scan.
+
+    :param rules: Rules to evaluate.
+    :type rules: list
+
+    :return: Generator of (pageid, matches) tuples, with matches as returned by `match_page`.
+    """
+    for page_id, name, text in pages:
+        yield page_id, match_page(rules, name, mwparserfromhell.parse(text))
+
+
+def rule_pages(bot, rules: list, namespace=0):
+    """Fetches every page transcluding any of the rules' templates, each page once.
+
+    :param bot: Logged in bot to fetch pages with.
+    :type bot: Mwbot
+
+    :param rules: Rules to fetch pages for.
+    :type rules: list
+
+    :param namespace: Namespace to list pages from, filtered by the server, defaults to mainspace.
+    :type namespace: int
+
+    :return: Generator of (pageid, title, wikitext) tuples.
+    """
+    titles = '|'.join(sorted({f'Template:{normalize_template_name(rule.template)}' for rule in rules}))
+    ids = dict.fromkeys(page['pageid'] for page in bot.iter_transcludedin(titles, namespace=str(namespace)))
+    yield from bot.page_texts(list(ids), parse=False)
+
+
+def dump_rule_pages(path: str, rules: list, namespaces=(0,)):
+    """Reads every page transcluding any of the rules' templates from an XML export.
+
+    :param path: Path to the dump file, which may be bz2 or gzip compressed.
+    :type path: str
+
+    :param rules: Rules to read pages for.
+    :type rules: list
+
+    :param namespaces: Namespace numbers of pages to read, defaults to mainspace only.
+    :type namespaces: tuple
+
+    :return: Generator of (pageid, title, wikitext) tuples.
+    """
+    patterns = [transclusion_pattern(template) for template in {rule.template for rule in rules}]
+    for page_id, name, text in iter_dump(path, namespaces=namespaces):
+        if any(pattern.search(text) is not None for pattern in patterns):
+            yield page_id, name, text
+
+
+def write_rule_outputs(rules: list, results):
+    """Streams matches to each rule's output file as they're found.
+
+    :param rules: The rules scanned for.
+    :type rules: list
+
+    :param results: (pageid, matches) tuples as yielded by `scan_rules`.
+
+    :return: Number of matches written for each rule, by rule name.
+    :rtype: dict
+    """
+    sinks = [open_sink(rule.output, rule_fields(rule)) for rule in rules]
+    counts = {rule.name: 0 for rule in rules}
+    try:
+        for page_id, matches in results:
+            for i, record in matches:
+                sinks[i].write(record)
+                counts[rules[i].name] += 1
+    finally:
+        for sink in sinks:
+            sink.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several template/heading reports in one crawl of the wiki.')
+    parser.add_argument('--rules', default=None,
+                        help='JSON file of rules to evaluate (default: just the historic item galleries)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of requests to keep in flight at once (default: 1)')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='maximum requests per second across all workers (default: unlimited)')
+    parser.add_argument('--maxlag', type=int, default=5,
+                        help='maxlag value sent with each request, in seconds (default: 5)')
+    parser.add_argument('--cache', default=None,
+                        help='SQLite revision cache; only pages edited since the last run are downloaded')
+    parser.add_argument('--dump', default=None,
+                        help='scan the mainspace pages of a local XML export (optionally .bz2/.gz) instead of the wiki')
+    args = parser.parse_args()
+
+    rules = load_rules(args.rules) if args.rules else [HISTORIC_GALLERIES]
+
+    if args.dump:
+        pages = dump_rule_pages(args.dump, rules)
+    else:
+        bot = mw.login_bot(args.workers, args.rate, args.maxlag, args.cache)
+        pages = rule_pages(bot, rules)
+
+    counts = write_rule_outputs(rules, scan_rules(pages, rules))
+    for rule in rules:
+        print(f'{rule.name}: {counts[rule.name]} matches written to {rule.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# MIT License
+#
+# Copyright (c) 2024 Chris Fisher ("cdfisher")
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""template_index.py - (c) 2024 Chris Fisher ("cdfisher")
+Parse-once index of template parameters and section headings across a corpus of pages, stored in SQLite so that
+report queries can be answered by lookups rather than by re-parsing wikitext.
+"""
+
+import re
+import sqlite3
+
+from mwparserfromhell.wikicode import Wikicode
+
+from parser_utils import COMMENT_RE, TemplateParams, compile_pattern, first_matching_heading
+
+VERSIONED_RE = re.compile(r"^(.*\D)(\d+)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (pageid INTEGER PRIMARY KEY, title TEXT NOT NULL, revid INTEGER);
+CREATE TABLE IF NOT EXISTS params (pageid INTEGER NOT NULL, template TEXT NOT NULL, version INTEGER NOT NULL,
+                                   param TEXT NOT NULL, value TEXT NOT NULL, ordinal INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS headings (pageid INTEGER NOT NULL, level INTEGER NOT NULL, title TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS params_lookup ON params (template, param);
+CREATE INDEX IF NOT EXISTS params_page ON params (pageid);
+CREATE INDEX IF NOT EXISTS headings_page ON headings (pageid);
+"""
+
+
+def _regexp(pattern, value):
+    return value is not None and compile_pattern(pattern).search(value) is not None
+
+
+def normalize_template_name(name: str) -> str:
+    """Normalizes a template name the way `Wikicode.matches` does, e.g. `infobox_Item` -> `Infobox Item`.
+
+    :param name: Template name with markup already stripped.
+    :type name: str
+
+    :return: The normalized template name.
+    :rtype: str
+    """
+    name = name.strip()
+    return (name[:1].upper() + name[1:]).replace('_', ' ')
+
+
+def template_rows(t) -> list:
+    """Splits a template's parameters into (version, param, value) rows.
+
+    Parameters are numbered versions of a base parameter (`release2` -> version 2 of `release`) only if the template
+    has a matching `version{n}` parameter, counting up from `version1` as `parser_utils` does; everything else is
+    stored as version 0. Values have surrounding whitespace and wikicode comments stripped. Where a parameter is given
+    more than once, the last value is kept, matching `Template.get`.
+
+    :param t: Template to split.
+    :type t: Template
+
+    :return: List of (version, param, value) tuples.
+    :rtype: list
+    """
+    tp = TemplateParams(t)
+    rows = []
+    for name in tp.params:
+        value = COMMENT_RE.sub("", tp.value(name))
+        m = VERSIONED_RE.match(name)
+        if m is not None and 1 <= int(m.group(2)) <= tp.n_versions:
+            rows.append((int(m.group(2)), m.group(1), value))
+        else:
+            rows.append((0, name, value))
+    return rows
+
+
+class TemplateIndex:
+    """SQLite index of (pageid, template, version, param, value) rows and section headings for a set of pages.
+
+    :param path: Path of the database file, created if it doesn't exist.
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.conn.create_function('REGEXP', 2, _regexp, deterministic=True)
+        # indexes built before templates were numbered get the column, with every template counted as the first
+        # until their pages are indexed again
+        if 'ordinal' not in [column[1] for column in self.conn.execute('PRAGMA table_info(params)')]:
+            self.conn.execute('ALTER TABLE params ADD COLUMN ordinal INTEGER NOT NULL DEFAULT 0')
+
+    def add_page(self, pageid: int, title: str, wikicode: Wikicode, revid=None):
+        """Indexes every template and heading on a page, replacing anything previously indexed for it.
+
+        :param pageid: ID of the page.
+        :type pageid: int
+
+        :param title: Title of the page.
+        :type title: str
+
+        :param wikicode: Parsed page contents.
+        :type wikicode: Wikicode
+
+        :param revid: Revision the contents belong to, if known.
+        :type revid: int
+        """
+        self.remove_page(pageid)
+        self.conn.execute('INSERT INTO pages VALUES (?, ?, ?)', (pageid, title, revid))
+
+        rows = []
+        # templates are numbered in page order, so that lookups can list matches in the order a scan finds them
+        for ordinal, t in enumerate(wikicode.filter_templates(recursive=True)):
+            template = normalize_template_name(t.name.strip_code())
+            rows.extend((pageid, template, version, param, value, ordinal)
+                        for version, param, value in template_rows(t))
+        self.conn.executemany('INSERT INTO params VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+        headings = [(pageid, h.level, str(h.title)) for h in wikicode.filter_headings(recursive=True)]
+        self.conn.executemany('INSERT INTO headings VALUES (?, ?, ?)', headings)
+
+    def remove_page(self, pageid: int):
+        """Removes a page and all of its rows from the index.
+
+        :param pageid: ID of the page.
+        :type pageid: int
+        """
+        for table in ('pages', 'params', 'headings'):
+            self.conn.execute(f'DELETE FROM {table} WHERE pageid = ?', (pageid,))
+
+    def build(self, pages, commit_every=500) -> int:
+        """Indexes an iterable of (pageid, title, wikicode) or (pageid, title, wikicode, revid) pages.
+
+        :param pages: Pages to index.
+        :type pages: iterable
+
+        :param commit_every: Number of pages to index between commits, defaults to 500.
+        :type commit_every: int
+
+        :return: Number of pages indexed.
+        :rtype: int
+        """
+        n = 0
+        for pageid, title, wikicode, *revid in pages:
+            self.add_page(pageid, title, wikicode, revid[0] if revid else None)
+            n += 1
+            if n % commit_every == 0:
+                self.commit()
+        self.commit()
+        return n
+
+    def matching_params(self, template: str, parameter: str, match_value: str) -> list:
+        """Finds values of a template parameter, in any version, that match a regular expression.
+
+        :param template: Name of the template.
+        :type template: str
+
+        :param parameter: Base name of the parameter, e.g. `release` for `release`, `release1`, `release2`...
+        :type parameter: str
+
+        :param match_value: Regular expression to search parameter values for.
+        :type match_value: str
+
+        :return: List of (pageid, title, version, value) tuples, in page order, then in the order the templates appear
+        on the page, then in version order.
+        :rtype: list
+        """
+        return self.conn.execute(
+            'SELECT params.pageid, pages.title, version, value FROM params JOIN pages USING (pageid) '
+            'WHERE template = ? AND param = ? AND value REGEXP ? ORDER BY params.pageid, ordinal, version',
+            (normalize_template_name(template), parameter, match_value)).fetchall()
+
+    def first_heading(self, pageid: int, match_value: str, case_sensitive=False):
+        """Finds the first heading on a page matching a regular expression.
+
+        :param pageid: ID of the page.
+        :type pageid: int
+
+        :param match_value: Regular expression to search heading titles for.
+        :type match_value: str
+
+        :param case_sensitive: Whether or not matching is case-sensitive, defaults to False.
+        :type case_sensitive: bool
+
+        :return: Title of the first matching heading, or None if there is none.
+        :rtype: str
+        """
+        rows = self.conn.execute('SELECT title FROM headings WHERE pageid = ? ORDER BY rowid', (pageid,))
+        return first_matching_heading((title for (title,) in rows), match_value, case_sensitive)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()